@@ -0,0 +1,113 @@
+"""信号処理ヘルパーモジュール - 複数のエフェクトで共有する低レベル処理"""
+
+from functools import lru_cache
+
+import numpy as np
+import scipy.fft
+import scipy.signal as signal
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+@lru_cache(maxsize=None)
+def hann_window(length, dtype=np.float32):
+    """周期的ハン窓（長さと型ごとにキャッシュするため読み取り専用）"""
+    window = signal.get_window('hann', length).astype(dtype)
+    window.flags.writeable = False
+    return window
+
+
+def stft(audio_data, n_fft, hop_length):
+    """実数信号のSTFT（rfftベース、中心揃え）
+
+    戻り値は (周波数ビン, フレーム) の複素行列（単精度の入力なら単精度）。
+    """
+    window = hann_window(n_fft, np.dtype(audio_data.dtype))
+    padded = np.pad(audio_data, n_fft // 2)
+    frames = sliding_window_view(padded, n_fft)[::hop_length] * window
+    return scipy.fft.rfft(frames, axis=-1, workers=-1).T
+
+
+def istft(stft_matrix, hop_length, length):
+    """stftの逆変換（窓の二乗和で正規化したオーバーラップ加算）"""
+    n_fft = 2 * (stft_matrix.shape[0] - 1)
+    window = hann_window(n_fft, stft_matrix.real.dtype)
+    frames = scipy.fft.irfft(stft_matrix.T, n=n_fft, axis=-1, workers=-1) * window
+
+    # オーバーラップ加算と窓の二乗和
+    output = overlap_add(frames, hop_length)
+    window_sum = overlap_add(np.broadcast_to(window ** 2, frames.shape), hop_length)
+    nonzero = window_sum > 1e-10
+    output[nonzero] /= window_sum[nonzero]
+
+    # 中心揃えのパディングを除去して長さを合わせる
+    output = output[n_fft // 2:n_fft // 2 + length]
+    if len(output) < length:
+        output = np.pad(output, (0, length - len(output)))
+    return output
+
+
+def apply_frequency_response(audio_data, response):
+    """rfftビン上の周波数応答をFIRフィルタとして時間領域で適用
+
+    responseの長さはn_fft // 2 + 1。STFT上でビンごとにゲインを掛けるのと同等の処理を、
+    応答から求めたインパルス応答との畳み込み1回で行う（ゼロ位相成分が中心に来るよう配置）。
+    """
+    n_fft = 2 * (len(response) - 1)
+    kernel = np.roll(scipy.fft.irfft(response, n=n_fft), n_fft // 2).astype(audio_data.dtype)
+    filtered = signal.oaconvolve(audio_data, kernel, mode='full')
+    return filtered[n_fft // 2:n_fft // 2 + len(audio_data)]
+
+
+def overlap_add(frames, hop_length):
+    """(フレーム数, フレーム長) の配列をホップ間隔で重ね合わせる"""
+    n_frames, frame_length = frames.shape
+    n_chunks = -(-frame_length // hop_length)
+
+    # フレームをホップ長のブロックに分け、ブロック単位でずらして加算
+    padded = np.zeros((n_frames, n_chunks * hop_length), dtype=frames.dtype)
+    padded[:, :frame_length] = frames
+    blocks = padded.reshape(n_frames, n_chunks, hop_length)
+
+    output = np.zeros((n_frames + n_chunks - 1, hop_length), dtype=frames.dtype)
+    for k in range(n_chunks):
+        output[k:k + n_frames] += blocks[:, k]
+
+    return output.reshape(-1)[:(n_frames - 1) * hop_length + frame_length]
+
+
+def pitch_shift_stft(stft, n_steps, hop_length):
+    """STFT上でフレームごとにピッチをシフトする（位相ボコーダ方式）
+
+    n_stepsはフレームごとのシフト量（半音単位）。
+    周波数軸を伸縮し、瞬時周波数を累積して位相を再構成する。
+    """
+    n_bins, n_frames = stft.shape
+    n_fft = 2 * (n_bins - 1)
+    magnitude = np.abs(stft)
+    phase = np.angle(stft)
+
+    # 各ビンの1ホップあたりの期待位相進み
+    bins = np.arange(n_bins)
+    omega = (2 * np.pi * hop_length / n_fft) * bins[:, np.newaxis]
+
+    # 実際の位相差から瞬時周波数を推定
+    delta = np.diff(phase, axis=1, prepend=phase[:, :1]) - omega
+    delta -= 2 * np.pi * np.round(delta / (2 * np.pi))
+    inst_freq = omega + delta
+
+    # フレームごとのシフト比率で周波数軸を伸縮（線形補間）
+    ratio = 2.0 ** (np.broadcast_to(n_steps, (n_frames,)) / 12.0)
+    source = bins[:, np.newaxis] / ratio[np.newaxis, :]
+    lower = np.minimum(np.floor(source).astype(np.intp), n_bins - 2)
+    frac = source - lower
+    frames = np.arange(n_frames)
+
+    shifted_mag = (1 - frac) * magnitude[lower, frames] + frac * magnitude[lower + 1, frames]
+    shifted_freq = ((1 - frac) * inst_freq[lower, frames] + frac * inst_freq[lower + 1, frames]) * ratio
+    shifted_mag[source > n_bins - 1] = 0
+
+    # 瞬時周波数を累積して位相を再構成
+    shifted_phase = phase[:, :1] + np.cumsum(shifted_freq, axis=1) - shifted_freq[:, :1]
+
+    # 位相の累積は倍精度で行い、結果は入力と同じ精度に戻す
+    return (shifted_mag * np.exp(1j * shifted_phase)).astype(stft.dtype, copy=False)
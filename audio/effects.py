@@ -1,21 +1,50 @@
 """音声エフェクトモジュール"""
 
+from functools import lru_cache
+
 import numpy as np
-import librosa
 import scipy.signal as signal
+from scipy.ndimage import uniform_filter1d
+from numpy.lib.stride_tricks import sliding_window_view
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+from audio import dsp
+
+# 乱数生成器（PCG64）
+_rng = np.random.default_rng()
+
+# ピッチ変動の処理に必要な最小サンプル数（これより短い音声は処理しない）
+_MIN_PITCH_FRAME = 256
+
+@lru_cache(maxsize=None)
+def _breath_filter(sample_rate):
+    """息の音用の低域通過FIRフィルタ（サンプリングレートごとにキャッシュ、単精度）"""
+    taps = signal.firwin(65, 2000, fs=sample_rate).astype(np.float32)
+    taps.flags.writeable = False
+    return taps
+
+@lru_cache(maxsize=None)
+def _segment_window(segment_length):
+    """セグメント用のハン窓（長さごとにキャッシュするため読み取り専用）"""
+    window = np.hanning(segment_length)
+    window.flags.writeable = False
+    return window
 
 def add_breathing(audio_data, sample_rate, breath_amount=0.1):
     """息の音を追加するエフェクト"""
     # 息の音のシミュレーション（ホワイトノイズをフィルタリング）
-    noise = np.random.normal(0, 0.01, size=len(audio_data))
+    noise = _rng.standard_normal(len(audio_data), dtype=np.float32) * 0.01
     
-    # 低域通過フィルタで息の音らしく
-    b, a = signal.butter(2, 2000 / (sample_rate/2), btype='low')
-    breath = signal.lfilter(b, a, noise)
+    # 低域通過フィルタで息の音らしく（FIRをFFTで畳み込み）
+    breath = signal.oaconvolve(noise, _breath_filter(sample_rate), mode='same')
     
     # 音声の振幅に合わせて息の音の強さを調整
     envelope = np.abs(audio_data)
-    envelope = np.convolve(envelope, np.ones(1000)/1000, mode='same')
+    uniform_filter1d(envelope, size=1000, mode='nearest', output=envelope)
     
     # 音声に息の音を混ぜる
     result = audio_data + breath * envelope * breath_amount
@@ -27,53 +56,42 @@ def adjust_pitch_variation(audio_data, sample_rate, variation_amount=0.3):
     if variation_amount <= 0:
         return audio_data
     
-    # 短いセグメントに分割して処理
-    segment_length = int(0.05 * sample_rate)  # 50ms
-    hop_length = segment_length // 2
-    
-    # 結果を格納する配列
-    result = np.zeros_like(audio_data)
+    # 1フレームに満たない短い音声はそのまま返す
+    if len(audio_data) < _MIN_PITCH_FRAME:
+        return audio_data
     
-    # 重みを格納する配列（オーバーラップ部分の処理用）
-    weights = np.zeros_like(audio_data)
+    # 音声全体を一度だけSTFT
+    n_fft = min(2048, 2**int(np.log2(len(audio_data))))
+    hop_length = max(1, n_fft // 4)
+    stft = dsp.stft(audio_data, n_fft, hop_length)
     
-    # ウィンドウ関数
-    window = np.hanning(segment_length)
+    # フレームごとのランダムなピッチシフト量（約50ms単位で滑らかに変化）
+    n_frames = stft.shape[1]
+    shifts = _rng.normal(0, variation_amount * 0.5, size=n_frames)
+    smooth_frames = max(1, int(0.05 * sample_rate) // hop_length)
+    shifts = uniform_filter1d(shifts, size=smooth_frames, mode='nearest')
     
-    for i in range(0, len(audio_data) - segment_length, hop_length):
-        # セグメントを取得
-        segment = audio_data[i:i+segment_length].copy()
-        
-        # ランダムなピッチシフト量
-        shift_amount = np.random.normal(0, variation_amount * 0.5)
-        
-        # ピッチシフト（非常に小さい変動）
-        if abs(shift_amount) > 0.01:
-            try:
-                shifted_segment = librosa.effects.pitch_shift(
-                    segment, 
-                    sr=sample_rate,
-                    n_steps=shift_amount,
-                    bins_per_octave=12
-                )
-            except:
-                shifted_segment = segment
-        else:
-            shifted_segment = segment
-        
-        # ウィンドウ関数を適用
-        shifted_segment = shifted_segment * window
-        
-        # 結果に追加
-        result[i:i+segment_length] += shifted_segment
-        weights[i:i+segment_length] += window
-    
-    # 重みで正規化（オーバーラップしている部分の処理）
-    weights[weights < 0.001] = 1.0  # ゼロ除算防止
-    result = result / weights
+    # 位相ボコーダでピッチシフトして再構成
+    shifted_stft = dsp.pitch_shift_stft(stft, shifts, hop_length)
+    result = dsp.istft(shifted_stft, hop_length, len(audio_data))
     
     return result
 
+def _overlap_add_varspeed(segments, window, output_starts, result, weights):
+    """可変ホップのオーバーラップ加算（範囲外のセグメントは無視）"""
+    n_segments, segment_length = segments.shape
+    for k in range(n_segments):
+        start = output_starts[k]
+        if start + segment_length > len(result):
+            continue
+        for j in range(segment_length):
+            result[start + j] += segments[k, j] * window[j]
+            weights[start + j] += window[j]
+
+# Numbaが利用可能な場合はネイティブコードにコンパイル
+if njit is not None:
+    _overlap_add_varspeed = njit(cache=True, fastmath=True)(_overlap_add_varspeed)
+
 def adjust_speed_variation(audio_data, sample_rate, variation_amount=0.3):
     """話速変動の自然さを調整"""
     if variation_amount <= 0:
@@ -83,45 +101,49 @@ def adjust_speed_variation(audio_data, sample_rate, variation_amount=0.3):
     segment_length = int(0.2 * sample_rate)  # 200ms
     hop_length = int(segment_length * 0.75)  # 75%のオーバーラップ
     
-    # 結果を格納する配列（長さは変わる可能性がある）
-    result = np.zeros(len(audio_data) + int(len(audio_data) * variation_amount * 0.5))
+    # セグメントの入力位置（末尾の端数セグメントは含めない）
+    n_segments = len(range(0, len(audio_data) - segment_length, hop_length))
+    if n_segments == 0:
+        return audio_data
     
-    # 重みを格納する配列
-    weights = np.zeros_like(result)
+    # 結果を格納する配列（長さは変わる可能性がある）
+    result_length = len(audio_data) + int(len(audio_data) * variation_amount * 0.5)
     
     # ウィンドウ関数
-    window = np.hanning(segment_length)
-    
-    # 出力位置のトラッキング
-    output_pos = 0
-    
-    for i in range(0, len(audio_data) - segment_length, hop_length):
-        # セグメントを取得
-        segment = audio_data[i:i+segment_length].copy()
-        
-        # ランダムな速度変化（わずかな伸縮）
-        speed_factor = 1.0 + np.random.normal(0, variation_amount * 0.1)
-        if speed_factor <= 0.8:
-            speed_factor = 0.8
-        elif speed_factor >= 1.2:
-            speed_factor = 1.2
+    window = _segment_window(segment_length)
+    
+    # 全セグメントを一括で取得（コピーなしのビュー）
+    segments = sliding_window_view(audio_data, segment_length)[::hop_length][:n_segments]
+    
+    # ランダムな速度変化（わずかな伸縮）を一括で生成
+    speed_factors = 1.0 + _rng.normal(0, variation_amount * 0.1, size=n_segments)
+    speed_factors = np.clip(speed_factors, 0.8, 1.2)
+    
+    # 出力位置（速度変化に応じて前進）
+    output_hops = (hop_length * speed_factors).astype(np.intp)
+    output_starts = np.concatenate(([0], np.cumsum(output_hops[:-1])))
+    
+    if njit is not None:
+        # コンパイル済みループでオーバーラップ加算
+        result = np.zeros(result_length)
+        weights = np.zeros(result_length)
+        _overlap_add_varspeed(segments, window, output_starts, result, weights)
+    else:
+        # 出力位置が配列の範囲内のセグメントのみ
+        in_range = output_starts + segment_length <= result_length
+        indices = output_starts[in_range, np.newaxis] + np.arange(segment_length)
         
-        # 速度変化をシミュレート（単純な方法）
-        if speed_factor != 1.0:
-            try:
-                # 時間軸の長さを変えずに内容を伸縮
-                segment = segment * window
-            except:
-                pass
-        
-        # 出力位置が配列の範囲内かチェック
-        if output_pos + segment_length <= len(result):
-            # ウィンドウ関数を適用したセグメントを結果に追加
-            result[output_pos:output_pos+segment_length] += segment * window
-            weights[output_pos:output_pos+segment_length] += window
-        
-        # 出力位置を更新（速度変化に応じて）
-        output_pos += int(hop_length * speed_factor)
+        # ウィンドウ関数を適用したセグメントと重みを一括でオーバーラップ加算
+        result = np.bincount(
+            indices.ravel(),
+            weights=(segments[in_range] * window).ravel(),
+            minlength=result_length
+        )
+        weights = np.bincount(
+            indices.ravel(),
+            weights=np.broadcast_to(window, indices.shape).ravel(),
+            minlength=result_length
+        )
     
     # 有効な部分のみを取得
     valid_length = np.max(np.nonzero(weights)[0]) + 1
@@ -132,12 +154,13 @@ def adjust_speed_variation(audio_data, sample_rate, variation_amount=0.3):
     weights[weights < 0.001] = 1.0  # ゼロ除算防止
     result = result / weights
     
-    # 元の長さにリサンプリング
+    # 元の長さに合わせて時間軸を線形補間で伸縮
     if len(result) != len(audio_data):
-        result = librosa.resample(
-            result, 
-            orig_sr=len(result),
-            target_sr=len(audio_data)
+        result = np.interp(
+            np.linspace(0, len(result) - 1, num=len(audio_data)),
+            np.arange(len(result)),
+            result
         )
     
-    return result
\ No newline at end of file
+    # 重みの累積は倍精度で行い、結果は入力と同じ精度に戻す
+    return result.astype(audio_data.dtype, copy=False)
\ No newline at end of file
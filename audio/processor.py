@@ -1,16 +1,84 @@
 """音声処理モジュール - 音声強化機能の中核エンジン"""
 
 import numpy as np
-import librosa
 import scipy.signal as signal
+from scipy.ndimage import uniform_filter1d
+import threading
 import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from audio import dsp
+
+# 乱数生成器（PCG64）
+_rng = np.random.default_rng()
+
+@lru_cache(maxsize=64)
+def _spectrum_ramp(n_bins, enhancement_level):
+    """高周波強調用の線形ゲイン（ビン数と強調レベルごとにキャッシュするため読み取り専用）"""
+    ramp = np.linspace(1.0, 1.0 + enhancement_level, num=n_bins, dtype=np.float32)
+    ramp.flags.writeable = False
+    return ramp
 
 class AudioProcessor:
     """音声処理の中核エンジン - 様々な処理を適用して音声を強化する"""
     
+    # 母音のフォルマント周波数
+    FORMANT_FREQS = {
+        'a': [800, 1200],   # 'あ'の音
+        'i': [300, 2500],   # 'い'の音
+        'u': [300, 900],    # 'う'の音
+        'e': [500, 1800],   # 'え'の音
+        'o': [500, 1000]    # 'お'の音
+    }
+    
     def __init__(self, sample_rate=24000):
         """初期化"""
         self.sample_rate = sample_rate
+        
+        # フィルタ設計は呼び出しごとではなく初期化時に一度だけ行う
+        self._formant_sos = self._design_formant_filters()
+        self._breath_fir = signal.firwin(65, 2000, fs=sample_rate).astype(np.float32)
+        
+        # FFTサイズごとのフォルマントフィルタ群の周波数応答
+        self._formant_responses = {}
+        
+        # 作業用バッファ（スレッドごとに保持して再利用）
+        self._local = threading.local()
+    
+    def _scratch_buffer(self, name, length, dtype=np.float32):
+        """名前と長さごとに作業用バッファを再利用して返す（内容は未初期化）"""
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        
+        buffer = buffers.get(name)
+        if buffer is None or len(buffer) != length or buffer.dtype != dtype:
+            buffer = buffers[name] = np.empty(length, dtype=dtype)
+        return buffer
+    
+    def _design_formant_filters(self):
+        """フォルマント強調用バンドパスフィルタ（二次セクション形式）を設計"""
+        nyquist = self.sample_rate / 2
+        filters = []
+        
+        for vowel, freqs in self.FORMANT_FREQS.items():
+            for freq in freqs:
+                try:
+                    freq_min = max(freq - 50, 20)
+                    freq_max = min(freq + 50, self.sample_rate // 2 - 1)
+                    
+                    filters.append(signal.butter(
+                        2, 
+                        [freq_min / nyquist, freq_max / nyquist],
+                        btype='band',
+                        output='sos'
+                    ))
+                except Exception as e:
+                    print(f"フィルタ設計エラー: {e}")
+        
+        return filters
     
     def enhance_audio(self, audio_data, settings):
         """音声強化の処理をまとめて実行"""
@@ -18,41 +86,15 @@ class AudioProcessor:
             return audio_data
         
         try:
-            # 各種パラメータを取得
-            spectrum_enhance = settings.get("spectrum_enhance", 0.5)
-            voice_quality = settings.get("voice_quality", 0.5)
-            fluctuation = settings.get("fluctuation", 0.3)
-            breathiness = settings.get("breathiness", 0.2)
-            pitch_variation = settings.get("pitch_variation", 0.4)
-            speed_variation = settings.get("speed_variation", 0.3)
-            
-            # 処理を適用
-            enhanced = audio_data.copy()
+            # 単精度で処理する
+            audio_data = np.asarray(audio_data, dtype=np.float32)
             
             # 短い音声に対応するためのチェック
-            if len(enhanced) >= 256:  # 最小限必要なサンプル数
-                # スペクトル強化処理
-                enhanced = self.enhance_spectrum(enhanced, spectrum_enhance)
-                
-                # 声質向上処理
-                enhanced = self.enhance_voice_quality(enhanced, voice_quality)
-                
-                # 息の音追加（息っぽさ）
-                if breathiness > 0.05:  # 閾値以上の場合のみ適用
-                    enhanced = self.add_breathiness(enhanced, breathiness)
-                
-                # 自然な揺らぎの追加
-                enhanced = self.add_natural_fluctuation(enhanced, fluctuation)
-                
-                # ピッチ変動（韻律）
-                if pitch_variation > 0.05:  # 閾値以上の場合のみ適用
-                    enhanced = self.enhance_pitch_variation(enhanced, pitch_variation)
-                
-                # 速度変動（韻律）
-                if speed_variation > 0.05:  # 閾値以上の場合のみ適用
-                    enhanced = self.enhance_speed_variation(enhanced, speed_variation)
+            if len(audio_data) >= 256:  # 最小限必要なサンプル数
+                enhanced = self._apply_enhancements(audio_data, settings)
             else:
                 print(f"警告: 音声が短すぎます ({len(audio_data)} サンプル)。処理をスキップします。")
+                enhanced = audio_data.copy()
             
             # 音量の正規化
             enhanced = self.normalize_audio(enhanced)
@@ -64,159 +106,259 @@ class AudioProcessor:
             traceback.print_exc()
             return audio_data
     
-    def enhance_spectrum(self, audio_data, enhancement_level=0.5):
-        """スペクトル強化処理 - 高周波数帯域を強調して明瞭さを向上させる"""
-        # 音声データの長さに基づいてFFTサイズを調整
+    def enhance_stream(self, chunks, settings, block_length=None, max_workers=2, target_level=0.9):
+        """音声強化の逐次実行 - 入力チャンクの反復から強化済みチャンクを順に返す
+        
+        50%オーバーラップのブロックごとに強化処理を行い、ハン窓でクロスフェードして
+        つなぎ合わせる。ブロック処理はスレッドプールで並行して実行する。
+        全体のピークは事前に分からないため正規化は行わず、それまでのピークが
+        target_levelを超えた場合にのみ音量を下げる（音量の調整は呼び出し側で行う）。
+        """
+        hop_length = block_length or int(0.2 * self.sample_rate)
+        frame_length = 2 * hop_length
+        window = dsp.hann_window(frame_length, np.float32)
+        
+        # 入力済みサンプル数（末尾の無音を切り詰めるために使用）
+        state = {"total": 0}
+        
+        def process(frame):
+            return self._apply_enhancements(frame, settings) * window
+        
+        pending = np.zeros(hop_length, dtype=np.float32)
+        emitted = 0
+        peak = 0.0
+        is_first = True
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = deque()
+            frames = self._stream_frames(chunks, hop_length, state)
+            
+            while True:
+                # 先読みしてワーカー数分のブロックを処理に投入
+                for frame in frames:
+                    futures.append(executor.submit(process, frame))
+                    if len(futures) > max_workers:
+                        break
+                if not futures:
+                    break
+                
+                # ブロックを順に取り出してオーバーラップ加算
+                processed = futures.popleft().result()
+                output = pending + processed[:hop_length]
+                pending = processed[hop_length:]
+                
+                # 先頭ブロックの前半は詰め物の無音なので出力しない
+                if is_first:
+                    is_first = False
+                    continue
+                
+                output = output[:max(0, state["total"] - emitted)]
+                if len(output) == 0:
+                    continue
+                emitted += len(output)
+                
+                # それまでのピークがtarget_levelを超えたときだけ抑える（小さい音は持ち上げない）
+                peak = max(peak, output.max(), -output.min())
+                if peak > target_level:
+                    output *= target_level / peak
+                
+                yield output
+    
+    def _stream_frames(self, chunks, hop_length, state):
+        """入力チャンクを50%オーバーラップのブロックに切り分ける"""
+        frame_length = 2 * hop_length
+        
+        # 先頭にホップ長分の無音を置き、全区間が2つのブロックで覆われるようにする
+        buffer = np.zeros(hop_length, dtype=np.float32)
+        
+        for chunk in chunks:
+            chunk = np.asarray(chunk, dtype=np.float32)
+            state["total"] += len(chunk)
+            buffer = np.concatenate((buffer, chunk))
+            
+            while len(buffer) >= frame_length:
+                yield buffer[:frame_length]
+                buffer = buffer[hop_length:]
+        
+        # 残りを無音で埋めて出力
+        n_remaining = -(-len(buffer) // hop_length)
+        buffer = np.pad(buffer, (0, (n_remaining + 1) * hop_length - len(buffer)))
+        for i in range(n_remaining):
+            yield buffer[i * hop_length:i * hop_length + frame_length]
+    
+    def _apply_enhancements(self, audio_data, settings):
+        """正規化を除く強化処理を順に適用（256サンプル以上の単精度音声が前提）"""
+        # 各種パラメータを取得
+        spectrum_enhance = settings.get("spectrum_enhance", 0.5)
+        voice_quality = settings.get("voice_quality", 0.5)
+        fluctuation = settings.get("fluctuation", 0.3)
+        breathiness = settings.get("breathiness", 0.2)
+        pitch_variation = settings.get("pitch_variation", 0.4)
+        speed_variation = settings.get("speed_variation", 0.3)
+        
+        # スペクトル強化・声質向上・ピッチ変動をSTFT領域でまとめて処理
+        # （新しい配列が返るので、以降の処理はこの配列をその場で書き換える）
+        enhanced = self.enhance_stft_domain(
+            audio_data,
+            spectrum_enhance,
+            voice_quality,
+            pitch_variation if pitch_variation > 0.05 else 0.0  # 閾値以上の場合のみ適用
+        )
+        
+        # 息の音追加（息っぽさ）
+        if breathiness > 0.05:  # 閾値以上の場合のみ適用
+            enhanced = self.add_breathiness(enhanced, breathiness)
+        
+        # 自然な揺らぎの追加
+        enhanced = self.add_natural_fluctuation(enhanced, fluctuation)
+        
+        # 速度変動（韻律）
+        if speed_variation > 0.05:  # 閾値以上の場合のみ適用
+            enhanced = self.enhance_speed_variation(enhanced, speed_variation)
+        
+        return enhanced
+    
+    def enhance_stft_domain(self, audio_data, spectrum_enhance=0.5, voice_quality=0.5, pitch_variation=0.4):
+        """STFT領域での一括処理 - スペクトル強化・声質向上・ピッチ変動を1回の変換で適用
+        
+        enhance_spectrum / enhance_voice_quality / enhance_pitch_variation を
+        順に適用するのと同等の処理を、STFTとiSTFTを1回ずつで行う。
+        ピッチ変動を適用しない場合はSTFTを使わず、ゲインをFIRとして畳み込む。
+        """
         n_fft = min(2048, 2**int(np.log2(len(audio_data))))
         hop_length = n_fft // 4
         
-        # スペクトル解析
-        stft = librosa.stft(audio_data, n_fft=n_fft, hop_length=hop_length)
-        magnitude, phase = librosa.magphase(stft)
+        # 高周波強調とフォルマント強調を周波数ビンごとのゲインにまとめる
+        gain = self._spectrum_gain(n_fft, spectrum_enhance) * self._formant_gain(n_fft, voice_quality)
         
-        # 高周波数帯域の強調
-        freq_enhance = np.linspace(1.0, 1.0 + enhancement_level, num=magnitude.shape[0])
-        enhanced_magnitude = magnitude * freq_enhance[:, np.newaxis]
+        # ピッチ変動なし（または音声が短すぎる）ならSTFTの往復は不要
+        if pitch_variation <= 0 or len(audio_data) // 4 < 256:
+            return dsp.apply_frequency_response(audio_data, gain)
+        
+        spectrum = dsp.stft(audio_data, n_fft, hop_length)
+        spectrum *= gain[:, np.newaxis]
+        
+        # ピッチ変動
+        shifts = self._pitch_shift_curve(spectrum.shape[1], pitch_variation)
+        spectrum = dsp.pitch_shift_stft(spectrum, shifts, hop_length)
+        
+        return dsp.istft(spectrum, hop_length, len(audio_data))
+    
+    def _spectrum_gain(self, n_fft, enhancement_level):
+        """高周波強調の周波数ビンごとのゲイン（読み取り専用）"""
+        return _spectrum_ramp(n_fft // 2 + 1, float(enhancement_level))
+    
+    def _formant_gain(self, n_fft, enhancement_level):
+        """フォルマント強調（元信号 + バンドパス出力の和）の周波数応答"""
+        response = self._formant_responses.get(n_fft)
+        if response is None:
+            # バンドパスフィルタ群の応答の和をFFTビン上で一度だけ評価
+            freqs = np.fft.rfftfreq(n_fft, 1 / self.sample_rate)
+            response = np.zeros(len(freqs), dtype=complex)
+            for sos in self._formant_sos:
+                response += signal.sosfreqz(sos, worN=freqs, fs=self.sample_rate)[1]
+            self._formant_responses[n_fft] = response
+        return 1.0 + response * (enhancement_level * 0.2)
+    
+    def _pitch_shift_curve(self, n_frames, variation_amount):
+        """フレームごとのごく小さなピッチシフト量（半音単位、自然な変動）"""
+        shifts = _rng.normal(0, variation_amount * 0.1, size=n_frames)
+        smooth_frames = 4  # 約1セグメント分
+        return uniform_filter1d(shifts, size=smooth_frames, mode='nearest')
+    
+    def enhance_spectrum(self, audio_data, enhancement_level=0.5):
+        """スペクトル強化処理 - 高周波数帯域を強調して明瞭さを向上させる"""
+        # 音声データの長さに基づいてFFTサイズを調整
+        n_fft = min(2048, 2**int(np.log2(len(audio_data))))
         
-        # スペクトル補正から音声を再構成
-        enhanced_stft = enhanced_magnitude * phase
-        enhanced_audio = librosa.istft(enhanced_stft, hop_length=hop_length, length=len(audio_data))
+        # 高周波数帯域の強調（STFTを経由せずFIRとして畳み込む）
+        freq_enhance = self._spectrum_gain(n_fft, enhancement_level)
+        enhanced_audio = dsp.apply_frequency_response(audio_data, freq_enhance)
         
         return enhanced_audio
     
     def enhance_voice_quality(self, audio_data, enhancement_level=0.5):
         """声質向上処理 - 母音のフォルマント周波数を強調"""
-        # 母音のフォルマント周波数を強調
-        formant_freqs = {
-            'a': [800, 1200],   # 'あ'の音
-            'i': [300, 2500],   # 'い'の音
-            'u': [300, 900],    # 'う'の音
-            'e': [500, 1800],   # 'え'の音
-            'o': [500, 1000]    # 'お'の音
-        }
-        
-        enhanced_audio = audio_data.copy()
-        
-        for vowel, freqs in formant_freqs.items():
-            for freq in freqs:
-                # バンドパスフィルタの作成
-                try:
-                    freq_min = max(freq - 50, 20)
-                    freq_max = min(freq + 50, self.sample_rate // 2 - 1)
-                    
-                    b, a = signal.butter(
-                        2, 
-                        [freq_min / (self.sample_rate/2), freq_max / (self.sample_rate/2)],
-                        btype='band'
-                    )
-                    
-                    # フィルタ適用
-                    filtered = signal.lfilter(b, a, audio_data)
-                    enhanced_audio += filtered * (enhancement_level * 0.2)
-                except Exception as e:
-                    print(f"フィルタ適用エラー: {e}")
+        n_fft = min(2048, 2**int(np.log2(len(audio_data))))
+        
+        # フォルマント帯域の強調をFIRとして一括適用
+        gain = self._formant_gain(n_fft, enhancement_level)
+        enhanced_audio = dsp.apply_frequency_response(audio_data, gain)
         
         return enhanced_audio
     
     def add_breathiness(self, audio_data, breath_amount=0.2):
-        """息の音を追加 - 声にリアルな息っぽさを加える"""
-        # ホワイトノイズを生成
-        noise = np.random.normal(0, 0.01, size=len(audio_data))
+        """息の音を追加 - 声にリアルな息っぽさを加える（入力配列をその場で書き換える）"""
+        # ホワイトノイズを生成（作業用バッファに直接書き込む）
+        noise = self._scratch_buffer("noise", len(audio_data))
+        _rng.standard_normal(dtype=np.float32, out=noise)
+        noise *= 0.01
         
-        # 息らしく整形するためのフィルタ
-        b, a = signal.butter(2, 2000 / (self.sample_rate/2), btype='low')
-        breath_noise = signal.lfilter(b, a, noise)
+        # 息らしく整形するためのフィルタ（FIRをFFTで畳み込み）
+        breath_noise = signal.oaconvolve(noise, self._breath_fir, mode='same')
         
         # 音声の振幅に合わせて息の音を調整
-        envelope = np.abs(audio_data)
-        # 包絡線をスムージング
+        envelope = self._scratch_buffer("envelope", len(audio_data), audio_data.dtype)
+        np.abs(audio_data, out=envelope)
+        # 包絡線をスムージング（作業用バッファ上でそのまま処理）
         window_size = min(1000, len(envelope) // 10)
         if window_size < 2:
             window_size = 2
-        smoothed_env = np.convolve(envelope, np.ones(window_size)/window_size, mode='same')
+        uniform_filter1d(envelope, size=window_size, mode='nearest', output=envelope)
         
         # 息の音を振幅に合わせて音声に加える
-        breathy_audio = audio_data + breath_noise * smoothed_env * breath_amount
+        breath_noise *= envelope
+        breath_noise *= breath_amount
+        audio_data += breath_noise
         
-        return breathy_audio
+        return audio_data
     
     def add_natural_fluctuation(self, audio_data, fluctuation_rate=0.3):
-        """自然な揺らぎを追加 - 機械的な安定さを軽減し自然さを向上"""
-        # 微小なランダム変動を生成
-        fluctuation = np.random.normal(1.0, fluctuation_rate * 0.05, size=len(audio_data))
+        """自然な揺らぎを追加 - 機械的な安定さを軽減し自然さを向上（入力配列をその場で書き換える）"""
+        # 微小なランダム変動を生成（作業用バッファに直接書き込む）
+        fluctuation = self._scratch_buffer("fluctuation", len(audio_data))
+        _rng.standard_normal(dtype=np.float32, out=fluctuation)
+        fluctuation *= fluctuation_rate * 0.05
+        fluctuation += 1.0
         
         # 急激な変化を防ぐためのスムージング
         window_size = min(128, len(audio_data) // 10)
         if window_size < 2:
             window_size = 2
             
-        smoothed_fluctuation = np.convolve(
-            fluctuation, 
-            np.ones(window_size) / window_size, 
-            mode='same'
-        )
+        uniform_filter1d(fluctuation, size=window_size, mode='nearest', output=fluctuation)
         
         # 揺らぎを適用
-        natural_audio = audio_data * smoothed_fluctuation
+        np.multiply(audio_data, fluctuation, out=audio_data)
         
-        return natural_audio
+        return audio_data
     
     def enhance_pitch_variation(self, audio_data, variation_amount=0.4):
         """ピッチ変動の強化 - より自然な抑揚を追加"""
-        # 音声を短いセグメントに分割
-        segment_length = min(2048, len(audio_data) // 4)
-        if segment_length < 256:
+        # 分析フレーム長を音声長に合わせて決定
+        n_fft = min(2048, len(audio_data) // 4)
+        if n_fft < 256:
             return audio_data  # 音声が短すぎる場合は処理をスキップ
         
-        hop_length = segment_length // 2
-        
-        # 結果を格納する配列
-        result = np.zeros_like(audio_data)
+        # iSTFTはビン数からフレーム長を復元するため、2のべき乗（偶数）に切り下げる
+        n_fft = 2**int(np.log2(n_fft))
         
-        # 重みを格納する配列（オーバーラップ部分の処理用）
-        weights = np.zeros_like(audio_data)
+        hop_length = n_fft // 4
         
-        # ウィンドウ関数
-        window = np.hanning(segment_length)
+        # 音声全体を一度だけSTFT
+        stft = dsp.stft(audio_data, n_fft, hop_length)
         
-        # 各セグメントを処理
-        for i in range(0, len(audio_data) - segment_length, hop_length):
-            # セグメントを取得
-            segment = audio_data[i:i+segment_length].copy()
-            
-            # ごく小さなピッチシフト量（自然な変動）
-            shift_amount = np.random.normal(0, variation_amount * 0.1)
-            
-            # 変動が小さすぎる場合はスキップ
-            if abs(shift_amount) < 0.01:
-                shifted_segment = segment
-            else:
-                try:
-                    # ピッチシフト処理
-                    shifted_segment = librosa.effects.pitch_shift(
-                        segment, 
-                        sr=self.sample_rate,
-                        n_steps=shift_amount
-                    )
-                except Exception as e:
-                    print(f"ピッチシフトエラー: {e}")
-                    shifted_segment = segment
-            
-            # ウィンドウ関数を適用
-            windowed_segment = shifted_segment * window
-            
-            # 結果に追加
-            result[i:i+segment_length] += windowed_segment
-            weights[i:i+segment_length] += window
+        # フレームごとのごく小さなピッチシフト量（自然な変動）
+        shifts = self._pitch_shift_curve(stft.shape[1], variation_amount)
         
-        # 重みで正規化（オーバーラップしている部分の処理）
-        weights[weights < 0.001] = 1.0  # ゼロ除算防止
-        normalized_result = result / weights
+        # 位相ボコーダでピッチシフトし、iSTFTでオーバーラップ加算
+        shifted_stft = dsp.pitch_shift_stft(stft, shifts, hop_length)
+        result = dsp.istft(shifted_stft, hop_length, len(audio_data))
         
-        return normalized_result
+        return result
     
     def enhance_speed_variation(self, audio_data, variation_amount=0.3):
-        """速度変動の強化 - より自然な話速変化を追加"""
+        """速度変動の強化 - より自然な話速変化を追加（入力配列をその場で書き換える）"""
         # 基本的な実装 - 完全な話速変化は計算コストが高いため簡易実装
         # 実際のアプリケーションでは、より高度なタイムストレッチアルゴリズムを検討
         
@@ -226,14 +368,18 @@ class AudioProcessor:
         
         # 小さなランダム変動を加えるだけの簡易実装
         # これは本当の速度変化ではなく、単なる振幅変調
-        modulation = 1.0 + np.sin(np.linspace(0, 10 * np.pi, len(audio_data))) * (variation_amount * 0.05)
-        modulated_audio = audio_data * modulation
+        modulation = np.linspace(0, 10 * np.pi, len(audio_data), dtype=np.float32)
+        np.sin(modulation, out=modulation)
+        modulation *= variation_amount * 0.05
+        modulation += 1.0
+        np.multiply(audio_data, modulation, out=audio_data)
         
-        return modulated_audio
+        return audio_data
     
     def normalize_audio(self, audio_data, target_level=0.9):
-        """音声の正規化 - 音量を適切なレベルに調整"""
-        max_val = np.max(np.abs(audio_data))
+        """音声の正規化 - 音量を適切なレベルに調整（入力配列をその場で書き換える）"""
+        # 絶対値の配列を作らずに最大振幅を求める
+        max_val = max(audio_data.max(), -audio_data.min())
         if max_val > 0:
-            return audio_data / max_val * target_level
+            np.multiply(audio_data, target_level / max_val, out=audio_data)
         return audio_data
\ No newline at end of file
@@ -2,18 +2,33 @@
 
 import os
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                             QPushButton, QSlider, QLabel, QTextEdit, 
                             QFileDialog, QMessageBox, QTabWidget, QProgressDialog)
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
+import numpy as np
 import soundfile as sf
 
 from gui.preview_panel import AudioPreviewPanel
-from gui.settings_panel import SettingsPanel
+from gui.settings_panel import SettingsPanel, PercentLabel
+from utils.file_utils import sanitize_filename
 
 class MainWindow(QMainWindow):
     """メインウィンドウ"""
     
+    # バッチ処理の1行分が完了したとき（行番号, 成功したか）
+    batch_line_done = pyqtSignal(int, bool)
+    
+    # VOICEVOXの接続確認が終わったとき（接続できたか, 話者情報を取得できたか）
+    connection_checked = pyqtSignal(bool, bool)
+    
+    # 単体の音声処理の進行状況（要求番号, メッセージ）
+    process_status = pyqtSignal(int, str)
+    
+    # 単体の音声処理が完了したとき（要求番号, 元の音声, 強化音声, サンプリングレート）
+    process_done = pyqtSignal(int, object, object, int)
+    
     def __init__(self, voicevox_connector, audio_processor):
         super().__init__()
         
@@ -31,6 +46,21 @@ class MainWindow(QMainWindow):
         self.sample_rate = 24000
         self.current_settings = {}
         
+        # 単体の音声合成・処理と接続確認用のワーカー（GUIスレッドを止めない）
+        # バッチ処理とは分け、実行中のバッチの後ろで待たされないようにする
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        
+        # バッチ処理用のワーカー（通信と処理・保存を並行させる）
+        self.batch_executor = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1))
+        self.batch_state = None
+        self.batch_line_done.connect(self._on_batch_line_done)
+        self.connection_checked.connect(self._on_connection_checked)
+        
+        # 単体処理の要求番号（古い要求の結果は破棄する）
+        self.process_id = 0
+        self.process_status.connect(self._on_process_status)
+        self.process_done.connect(self._on_process_done)
+        
         # UI初期化
         self.init_ui()
         
@@ -63,9 +93,16 @@ class MainWindow(QMainWindow):
         self.speaker_slider = QSlider(Qt.Horizontal)
         self.speaker_slider.setRange(1, 10)
         self.speaker_slider.setValue(1)
-        self.speaker_slider.valueChanged.connect(self.update_speaker_label)
         speaker_layout.addWidget(self.speaker_slider)
         
+        # ドラッグ中の連続した変更はまとめ、最後の値でのみラベルを更新する
+        self.speaker_label_timer = QTimer(self)
+        self.speaker_label_timer.setSingleShot(True)
+        self.speaker_label_timer.setInterval(50)
+        self.speaker_label_timer.timeout.connect(self.update_speaker_label)
+        # start(int)の多重定義に値が渡らないよう、引数なしで再始動する
+        self.speaker_slider.valueChanged.connect(lambda _: self.speaker_label_timer.start())
+        
         self.speaker_label = QLabel("1: 話者情報取得中...")
         speaker_layout.addWidget(self.speaker_label)
         
@@ -80,10 +117,8 @@ class MainWindow(QMainWindow):
         self.enhance_slider.setValue(50)
         enhance_layout.addWidget(self.enhance_slider)
         
-        self.enhance_label = QLabel("50%")
-        self.enhance_slider.valueChanged.connect(
-            lambda v: self.enhance_label.setText(f"{v}%")
-        )
+        self.enhance_label = PercentLabel("50%")
+        self.enhance_slider.valueChanged.connect(self.enhance_label.setPercent)
         enhance_layout.addWidget(self.enhance_label)
         
         left_layout.addLayout(enhance_layout)
@@ -125,13 +160,22 @@ class MainWindow(QMainWindow):
         main_layout.addWidget(right_panel, 1)
     
     def check_voicevox_connection(self):
-        """VOICEVOXとの接続を確認"""
+        """VOICEVOXとの接続を確認（通信はワーカースレッドで行い、接続を事前に確立しておく）"""
         self.status_label.setText("VOICEVOXとの接続を確認中...")
-        
-        if self.voicevox.test_connection():
+        self.executor.submit(self._run_connection_check)
+    
+    def _run_connection_check(self):
+        """接続確認と話者情報の取得（ワーカースレッドで実行）"""
+        connected = self.voicevox.test_connection()
+        speakers_loaded = connected and self.voicevox.get_speakers()
+        self.connection_checked.emit(connected, speakers_loaded)
+    
+    def _on_connection_checked(self, connected, speakers_loaded):
+        """接続確認の結果を反映（GUIスレッド）"""
+        if connected:
             self.status_label.setText("VOICEVOX接続成功")
             # 話者情報を取得
-            if self.voicevox.get_speakers():
+            if speakers_loaded:
                 # 話者の最大数に基づいてスライダーの範囲を設定
                 max_id = max(self.voicevox.speakers.keys()) if self.voicevox.speakers else 1
                 self.speaker_slider.setRange(1, max_id)
@@ -151,10 +195,12 @@ class MainWindow(QMainWindow):
     def update_speaker_label(self):
         """話者ラベルの更新"""
         speaker_id = self.speaker_slider.value()
-        if speaker_id in self.voicevox.speakers:
-            self.speaker_label.setText(f"{speaker_id}: {self.voicevox.speakers[speaker_id]}")
-        else:
-            self.speaker_label.setText(f"{speaker_id}")
+        speaker_name = self.voicevox.speakers.get(speaker_id)
+        text = f"{speaker_id}: {speaker_name}" if speaker_name else f"{speaker_id}"
+        
+        # 表示が変わらない場合は再描画しない
+        if text != self.speaker_label.text():
+            self.speaker_label.setText(text)
     
     def update_settings(self, settings):
         """詳細設定の更新"""
@@ -166,7 +212,9 @@ class MainWindow(QMainWindow):
             self.process_audio(reprocess=True)
     
     def process_audio(self, reprocess=False):
-        """音声合成と処理の実行"""
+        """音声合成と処理の実行（ワーカースレッドで実行し、完了後にプレビューへ反映）"""
+        text = None
+        speaker_id = None
         if not reprocess:
             # 入力テキストの取得
             text = self.text_input.toPlainText()
@@ -174,37 +222,65 @@ class MainWindow(QMainWindow):
                 self.status_label.setText("テキストを入力してください")
                 return
             
+            # VOICEVOX話者ID
+            speaker_id = self.speaker_slider.value()
             self.status_label.setText("音声合成中...")
-            
+        else:
+            self.status_label.setText("音声処理中...")
+        
+        # 基本パラメータ
+        enhancement_level = self.enhance_slider.value() / 100.0
+        
+        # 詳細設定（設定されていれば使用）
+        if not self.current_settings:
+            self.current_settings = self.settings_panel.get_current_settings()
+        
+        # 基本強化レベルを反映
+        self.current_settings["spectrum_enhance"] = enhancement_level
+        
+        # 新しい要求として処理を開始（設定はワーカー用に複製して渡す）
+        self.process_id += 1
+        self.executor.submit(
+            self._run_process, self.process_id, text, speaker_id,
+            self.original_audio, self.sample_rate, dict(self.current_settings)
+        )
+    
+    def _run_process(self, process_id, text, speaker_id, original_audio, sample_rate, settings):
+        """音声合成と処理の本体（ワーカースレッドで実行）"""
+        if text is not None:
             try:
-                # VOICEVOX話者ID
-                speaker_id = self.speaker_slider.value()
-                
                 # 音声合成
-                self.original_audio, self.sample_rate = self.voicevox.text_to_speech(text, speaker_id)
+                original_audio, sample_rate = self.voicevox.text_to_speech(text, speaker_id)
             except Exception as e:
-                self.status_label.setText(f"音声合成エラー: {str(e)}")
+                self.process_status.emit(process_id, f"音声合成エラー: {str(e)}")
                 return
-        
-        # 音声処理
-        self.status_label.setText("音声処理中...")
+            
+            self.process_status.emit(process_id, "音声処理中...")
         
         try:
-            # 基本パラメータ
-            enhancement_level = self.enhance_slider.value() / 100.0
-            
-            # 詳細設定（設定されていれば使用）
-            if not self.current_settings:
-                self.current_settings = self.settings_panel.get_current_settings()
-            
-            # 基本強化レベルを反映
-            self.current_settings["spectrum_enhance"] = enhancement_level
-            
             # 音声処理
-            self.enhanced_audio = self.processor.enhance_audio(
-                self.original_audio, 
-                self.current_settings
-            )
+            enhanced_audio = self.processor.enhance_audio(original_audio, settings)
+        except Exception as e:
+            self.process_status.emit(process_id, f"処理エラー: {str(e)}")
+            traceback.print_exc()
+            return
+        
+        self.process_done.emit(process_id, original_audio, enhanced_audio, sample_rate)
+    
+    def _on_process_status(self, process_id, message):
+        """単体処理の進行状況を表示（GUIスレッド）"""
+        if process_id == self.process_id:
+            self.status_label.setText(message)
+    
+    def _on_process_done(self, process_id, original_audio, enhanced_audio, sample_rate):
+        """単体処理の結果をプレビューに反映（GUIスレッド）"""
+        if process_id != self.process_id:
+            return
+        
+        try:
+            self.original_audio = original_audio
+            self.enhanced_audio = enhanced_audio
+            self.sample_rate = sample_rate
             
             # プレビューパネルに設定
             self.preview_panel.set_audio_data(
@@ -240,8 +316,13 @@ class MainWindow(QMainWindow):
             if not file_path:
                 return
             
-            # 音声の保存
-            sf.write(file_path, self.enhanced_audio, self.sample_rate)
+            # 音声の保存（プレビュー用に作成済みの16bit WAVデータがあれば再エンコードしない）
+            wav_bytes = self.preview_panel.get_wav_bytes("enhanced")
+            if wav_bytes is not None:
+                with open(file_path, 'wb') as f:
+                    f.write(wav_bytes)
+            else:
+                sf.write(file_path, np.clip(self.enhanced_audio, -1.0, 1.0), self.sample_rate, subtype='PCM_16')
             
             self.status_label.setText(f"保存完了: {file_path}")
             
@@ -292,48 +373,114 @@ class MainWindow(QMainWindow):
             )
             progress.setWindowTitle("バッチ処理")
             progress.setWindowModality(Qt.WindowModal)
+            progress.setMinimumDuration(0)
+            progress.setValue(0)
             
-            # 各行を処理
-            processed_count = 0
+            # 各行の処理をワーカースレッドに投入（完了はbatch_line_doneで通知される）
+            self.batch_button.setEnabled(False)
+            self.batch_state = {
+                "lines": lines,
+                "output_dir": output_dir,
+                "progress": progress,
+                "remaining": len(lines),
+                "done": 0,
+                "processed": 0,
+                "futures": []
+            }
             for i, text in enumerate(lines):
-                if progress.wasCanceled():
-                    break
-                
-                progress.setValue(i)
-                progress.setLabelText(f"処理中: {text[:30]}...")
-                
-                try:
-                    # ファイル名の生成（日本語や特殊文字を考慮）
-                    file_name = f"{i+1:03d}_{text[:20]}.wav"
-                    file_name = "".join(c for c in file_name if c.isalnum() or c in "._- ")
-                    output_path = os.path.join(output_dir, file_name)
-                    
-                    # 音声合成
-                    audio_data, sample_rate = self.voicevox.text_to_speech(text, speaker_id)
-                    
-                    # 音声処理
-                    enhanced_audio = self.processor.enhance_audio(audio_data, settings)
-                    
-                    # 保存
-                    sf.write(output_path, enhanced_audio, sample_rate)
-                    
-                    processed_count += 1
-                    
-                except Exception as e:
-                    print(f"行 {i+1} の処理エラー: {e}")
+                future = self.batch_executor.submit(
+                    self._process_batch_line, i, text, speaker_id, settings, output_dir
+                )
+                self.batch_state["futures"].append(future)
             
-            progress.setValue(len(lines))
+            progress.canceled.connect(self._cancel_batch)
             
-            # 処理完了メッセージ
-            QMessageBox.information(
-                self,
-                "バッチ処理完了",
-                f"{processed_count}件のテキストを処理しました。\n"
-                f"出力先: {output_dir}"
-            )
+        except Exception as e:
+            self.status_label.setText(f"バッチ処理エラー: {str(e)}")
+            traceback.print_exc()
+    
+    def _process_batch_line(self, index, text, speaker_id, settings, output_dir):
+        """バッチ処理の1行分（ワーカースレッドで実行）"""
+        success = False
+        try:
+            # ファイル名の生成（日本語や特殊文字を考慮）
+            file_name = f"{index+1:03d}_{text[:20]}.wav"
+            file_name = sanitize_filename(file_name)
+            output_path = os.path.join(output_dir, file_name)
+            
+            # 音声合成
+            audio_data, sample_rate = self.voicevox.text_to_speech(text, speaker_id)
             
-            self.status_label.setText(f"バッチ処理完了: {processed_count}/{len(lines)}件")
+            # 音声処理
+            enhanced_audio = self.processor.enhance_audio(audio_data, settings)
+            
+            # 保存（16bit PCMで書き出してファイルサイズを半分にする）
+            np.clip(enhanced_audio, -1.0, 1.0, out=enhanced_audio)
+            sf.write(output_path, enhanced_audio, sample_rate, subtype='PCM_16')
+            
+            success = True
             
         except Exception as e:
-            self.status_label.setText(f"バッチ処理エラー: {str(e)}")
-            traceback.print_exc()
\ No newline at end of file
+            print(f"行 {index+1} の処理エラー: {e}")
+        
+        # GUIスレッドへ完了を通知
+        self.batch_line_done.emit(index, success)
+    
+    def _on_batch_line_done(self, index, success):
+        """バッチ処理の1行分の完了処理（GUIスレッド）"""
+        state = self.batch_state
+        if state is None:
+            return
+        
+        state["remaining"] -= 1
+        state["done"] += 1
+        if success:
+            state["processed"] += 1
+        
+        progress = state["progress"]
+        if not progress.wasCanceled():
+            progress.setValue(state["done"])
+            progress.setLabelText(f"処理完了: {state['lines'][index][:30]}...")
+        
+        if state["remaining"] <= 0:
+            self._finish_batch()
+    
+    def _cancel_batch(self):
+        """バッチ処理のキャンセル（未着手の行を取り消す）"""
+        state = self.batch_state
+        if state is None:
+            return
+        
+        cancelled = sum(1 for future in state["futures"] if future.cancel())
+        state["remaining"] -= cancelled
+        
+        if state["remaining"] <= 0:
+            self._finish_batch()
+    
+    def _finish_batch(self):
+        """バッチ処理の完了報告"""
+        state = self.batch_state
+        self.batch_state = None
+        self.batch_button.setEnabled(True)
+        
+        state["progress"].setValue(len(state["lines"]))
+        
+        # 処理完了メッセージ
+        QMessageBox.information(
+            self,
+            "バッチ処理完了",
+            f"{state['processed']}件のテキストを処理しました。\n"
+            f"出力先: {state['output_dir']}"
+        )
+        
+        self.status_label.setText(f"バッチ処理完了: {state['processed']}/{len(state['lines'])}件")
+    
+    def closeEvent(self, event):
+        """ウィンドウが閉じられるときの処理"""
+        # 未着手の処理を取り消してワーカーを停止
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.batch_executor.shutdown(wait=False, cancel_futures=True)
+        
+        # VOICEVOXとの接続を解放
+        self.voicevox.close()
+        super().closeEvent(event)
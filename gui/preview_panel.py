@@ -5,11 +5,24 @@ from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
 from PyQt5.QtCore import Qt, QTimer, pyqtSignal, QByteArray, QBuffer, QIODevice, QUrl
 from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent
 import numpy as np
-import io
-import tempfile
-import os
 import soundfile as sf
+import struct
 import wave
+import os
+import hashlib
+
+def _build_wav_bytes(pcm, sample_rate):
+    """16bit PCM配列から44バイトのRIFFヘッダ付きWAVバイト列を作成"""
+    channels = 1 if pcm.ndim == 1 else pcm.shape[1]
+    data = pcm.astype('<i2', copy=False).tobytes()
+    
+    header = (
+        b'RIFF' + struct.pack('<I', 36 + len(data)) + b'WAVE'
+        + b'fmt ' + struct.pack('<IHHIIHH', 16, 1, channels, sample_rate,
+                                sample_rate * channels * 2, channels * 2, 16)
+        + b'data' + struct.pack('<I', len(data))
+    )
+    return header + data
 
 class AudioPreviewPanel(QWidget):
     """音声プレビューパネル - QMediaPlayerを使用した実装"""
@@ -24,16 +37,44 @@ class AudioPreviewPanel(QWidget):
         self.audio_length = 0  # 秒単位
         self.current_position = 0  # ミリ秒単位
         
-        # 音声データ
-        self.original_audio = None
-        self.enhanced_audio = None
+        # スライダー操作中は再生位置の更新で上書きしない
+        self._dragging = False
+        
+        # 最後に表示した時間（秒単位、変化がなければ表示を更新しない）
+        self._last_time_key = None
+        
+        # 連続したシークをまとめるためのタイマー（最新の目標位置のみ反映）
+        self._pending_seek = None
+        self._seek_timer = QTimer(self)
+        self._seek_timer.setSingleShot(True)
+        self._seek_timer.setInterval(50)
+        self._seek_timer.timeout.connect(self._flush_seek)
+        
+        # 音声データ（配列は保持せず、エンコード済みWAVデータのみ保持する）
         self.sample_rate = 24000
         
-        # メディアプレーヤーの初期化
-        self.player = QMediaPlayer()
-        self.player.positionChanged.connect(self.update_position)
-        self.player.stateChanged.connect(self.handle_state_change)
-        self.player.mediaStatusChanged.connect(self.handle_media_status_change)
+        # エンコード済みWAVデータ（"original" / "enhanced" → bytes）
+        self._wav_cache = {}
+        
+        # ファイルから直接再生する音声（"original" / "enhanced" → パス）
+        self._media_files = {}
+        
+        # 前回設定した音声データの指紋（同じデータなら変換を省略する）
+        self._fingerprint = None
+        
+        # 量子化用の作業バッファ（これまでの最大長で確保して使い回す）
+        self._float_scratch = None
+        self._pcm_scratch = None
+        
+        # メディアプレーヤーの初期化（切り替え時に読み込み直さないよう音声ごとに用意）
+        self.players = {}
+        self.media_buffers = {}  # 各プレーヤーのWAVデータを保持するQBuffer
+        for audio_type in ("original", "enhanced"):
+            player = QMediaPlayer()
+            player.positionChanged.connect(self.update_position)
+            player.stateChanged.connect(self.handle_state_change)
+            player.mediaStatusChanged.connect(self.handle_media_status_change)
+            self.players[audio_type] = player
         
         # 現在再生中のタイプ
         self.current_type = "enhanced"  # "original" または "enhanced"
@@ -41,6 +82,11 @@ class AudioPreviewPanel(QWidget):
         # UI初期化
         self.initUI()
     
+    @property
+    def player(self):
+        """現在選択されている音声のプレーヤー"""
+        return self.players[self.current_type]
+    
     def initUI(self):
         """UIコンポーネントの初期化"""
         layout = QVBoxLayout(self)
@@ -67,7 +113,8 @@ class AudioPreviewPanel(QWidget):
         self.position_slider = QSlider(Qt.Horizontal)
         self.position_slider.setRange(0, 100)
         self.position_slider.setValue(0)
-        self.position_slider.sliderReleased.connect(self.seek_position)
+        self.position_slider.sliderPressed.connect(self._on_slider_pressed)
+        self.position_slider.sliderReleased.connect(self._on_slider_released)
         self.position_slider.setEnabled(False)
         layout.addWidget(self.position_slider)
         
@@ -96,19 +143,21 @@ class AudioPreviewPanel(QWidget):
         self.progress_bar.setValue(0)
         layout.addWidget(self.progress_bar)
     
-    def set_audio_data(self, original_data, enhanced_data, sample_rate):
-        """音声データの設定"""
+    def set_audio_data(self, original_data, enhanced_data, sample_rate=None):
+        """音声データの設定（配列またはWAVファイルのパスを指定）"""
         try:
             # 既存の再生を停止
             self.stop_playback()
             
-            # データを格納
-            self.original_audio = original_data
-            self.enhanced_audio = enhanced_data
-            self.sample_rate = sample_rate
-            
-            # 音声の長さを計算
-            self.audio_length = len(original_data) / sample_rate * 1000  # ミリ秒単位
+            # 前回と同じデータなら変換と読み込みを省略
+            # （ファイルを含む場合は毎回読み込む）
+            digests = (self._digest(original_data), self._digest(enhanced_data))
+            fingerprint = None if None in digests else digests + (sample_rate,)
+            if fingerprint is None or fingerprint != self._fingerprint:
+                self._fingerprint = None
+                identical = digests[0] is not None and digests[0] == digests[1]
+                self._load_audio_data(original_data, enhanced_data, sample_rate, identical)
+                self._fingerprint = fingerprint
             
             # UIを有効化
             self.play_button.setEnabled(True)
@@ -124,6 +173,7 @@ class AudioPreviewPanel(QWidget):
             mins = int(self.audio_length / 1000) // 60
             secs = int(self.audio_length / 1000) % 60
             self.time_label.setText(f"00:00 / {mins:02d}:{secs:02d}")
+            self._last_time_key = (0, int(self.audio_length / 1000))
             
             self.status_label.setText("音声データを読み込みました")
             
@@ -132,26 +182,93 @@ class AudioPreviewPanel(QWidget):
             import traceback
             traceback.print_exc()
     
+    def _load_audio_data(self, original_data, enhanced_data, sample_rate, identical=False):
+        """音声データを変換してプレーヤーに読み込む（identicalなら強化音声は元の音声を共有）"""
+        # 音声の長さを計算（ファイルの場合はヘッダのみ読み込む）
+        if isinstance(original_data, (str, os.PathLike)):
+            info = sf.info(original_data)
+            if sample_rate is None:
+                sample_rate = info.samplerate
+            self.audio_length = info.frames / info.samplerate * 1000  # ミリ秒単位
+        else:
+            self.audio_length = len(original_data) / sample_rate * 1000  # ミリ秒単位
+        
+        # データを格納
+        self.sample_rate = sample_rate
+        
+        # 切り替えのたびに変換しないよう、WAVデータを一度だけ作成
+        # ファイルはサンプルを読み込まずプレーヤーで直接再生する
+        # （変換が途中で失敗しても、読み込み済みのデータとプレーヤーはそのまま残す）
+        wav_cache = {}
+        media_files = {}
+        for audio_type, data in (("original", original_data), ("enhanced", enhanced_data)):
+            if isinstance(data, (str, os.PathLike)):
+                media_files[audio_type] = os.fspath(data)
+            elif audio_type == "enhanced" and identical:
+                wav_cache[audio_type] = wav_cache["original"]
+            else:
+                wav_cache[audio_type] = self._encode_wav(data, sample_rate)
+        self._wav_cache = wav_cache
+        self._media_files = media_files
+        
+        # 両方のプレーヤーに新しいメディアを設定してから、古いバッファを手放す
+        # （プレーヤーが参照中のQBufferを先に解放しないようにする）
+        media_buffers = {}
+        for audio_type in self.players:
+            self._load_media(audio_type, media_buffers)
+        self.media_buffers = media_buffers
+    
+    @staticmethod
+    def _digest(data):
+        """音声配列の内容のハッシュ（ファイルパスの場合はNone）"""
+        if isinstance(data, (str, os.PathLike)):
+            return None
+        data = np.ascontiguousarray(data)
+        digest = hashlib.blake2b(data, digest_size=8)
+        digest.update(f"{data.dtype.str}{data.shape}".encode())
+        return digest.digest()
+    
     def prepare_media(self):
-        """現在選択されている音声データをメディアに変換"""
+        """現在選択されている音声のメディアを準備（読み込み済みなら何もしない）"""
+        if self.current_type in self.media_buffers:
+            return True
+        return self._load_media(self.current_type)
+    
+    def _has_source(self, audio_type):
+        """再生できる音声データ（WAVデータまたはファイル）があるか"""
+        return self._wav_cache.get(audio_type) is not None or audio_type in self._media_files
+    
+    def _load_media(self, audio_type, media_buffers=None):
+        """エンコード済みWAVデータまたはファイルをプレーヤーに設定（バッファはmedia_buffersに保持）"""
+        if media_buffers is None:
+            media_buffers = self.media_buffers
         try:
-            # 使用するデータを選択
-            audio_data = None
-            if self.current_type == "original" and self.original_audio is not None:
-                audio_data = self.original_audio
-            elif self.current_type == "enhanced" and self.enhanced_audio is not None:
-                audio_data = self.enhanced_audio
-            else:
-                return False
+            # ファイルはプレーヤーのファイル再生機能に任せる（バッファは不要）
+            path = self._media_files.get(audio_type)
+            if path is not None:
+                self.players[audio_type].setMedia(QMediaContent(QUrl.fromLocalFile(path)))
+                media_buffers[audio_type] = None
+                return True
             
-            # 一時ファイルを作成
-            temp_path = self._create_temp_wav(audio_data, self.sample_rate)
-            if not temp_path:
+            # 使用するデータを選択（set_audio_dataで作成済みのWAVデータ）
+            wav_bytes = self._wav_cache.get(audio_type)
+            if wav_bytes is None:
                 return False
             
-            # メディアコンテンツを設定
-            media_content = QMediaContent(QUrl.fromLocalFile(temp_path))
-            self.player.setMedia(media_content)
+            # 同じWAVデータを読み込み済みならQByteArrayを共有する
+            for other_type, other_buffer in media_buffers.items():
+                if other_buffer is not None and self._wav_cache.get(other_type) is wav_bytes:
+                    data = other_buffer.data()
+                    break
+            else:
+                data = QByteArray(wav_bytes)
+            
+            # QBuffer経由でメディアを設定（再生中はバッファを保持しておく）
+            media_buffer = QBuffer()
+            media_buffer.setData(data)
+            media_buffer.open(QIODevice.ReadOnly)
+            self.players[audio_type].setMedia(QMediaContent(), media_buffer)
+            media_buffers[audio_type] = media_buffer
             
             return True
         except Exception as e:
@@ -160,31 +277,31 @@ class AudioPreviewPanel(QWidget):
             traceback.print_exc()
             return False
     
-    def _create_temp_wav(self, audio_data, sample_rate):
-        """一時WAVファイルを作成"""
+    def get_wav_bytes(self, audio_type):
+        """エンコード済みWAVデータを取得（"original" または "enhanced"、未設定ならNone）"""
+        return self._wav_cache.get(audio_type)
+    
+    def _encode_wav(self, audio_data, sample_rate):
+        """音声データをメモリ上でWAV形式のバイト列に変換"""
         try:
-            # カレントディレクトリ内のtempディレクトリ
-            temp_dir = "./temp"
-            if not os.path.exists(temp_dir):
-                os.makedirs(temp_dir)
-            
-            # 既存のファイルをすべて削除
-            for file_name in os.listdir(temp_dir):
-                if file_name.endswith(".wav"):
-                    try:
-                        os.remove(os.path.join(temp_dir, file_name))
-                    except:
-                        pass
+            # 16bit PCMに量子化してから書き出す（作業バッファ上で計算）
+            audio_data = np.asarray(audio_data)
+            n = audio_data.size
+            if self._pcm_scratch is None or len(self._pcm_scratch) < n:
+                self._float_scratch = np.empty(n, dtype=np.float32)
+                self._pcm_scratch = np.empty(n, dtype=np.int16)
             
-            # 新しいファイル名
-            temp_path = os.path.join(temp_dir, f"audio_{self.current_type}.wav")
+            scaled = self._float_scratch[:n].reshape(audio_data.shape)
+            pcm = self._pcm_scratch[:n].reshape(audio_data.shape)
+            # 切り捨てではなく最も近い整数に丸めて量子化する
+            np.multiply(audio_data, 32767, out=scaled, casting='unsafe')
+            np.rint(scaled, out=scaled)
+            np.clip(scaled, -32768, 32767, out=scaled)
+            np.copyto(pcm, scaled, casting='unsafe')
             
-            # WAVファイルとして保存
-            sf.write(temp_path, audio_data, sample_rate)
-            
-            return temp_path
+            return _build_wav_bytes(pcm, int(sample_rate))
         except Exception as e:
-            self.status_label.setText(f"一時ファイル作成エラー: {str(e)}")
+            self.status_label.setText(f"WAV変換エラー: {str(e)}")
             import traceback
             traceback.print_exc()
             return None
@@ -224,7 +341,7 @@ class AudioPreviewPanel(QWidget):
     
     def play_original(self):
         """元の音声を再生"""
-        if self.original_audio is None:
+        if not self._has_source("original"):
             return
         
         self.stop_playback()
@@ -237,7 +354,7 @@ class AudioPreviewPanel(QWidget):
     
     def play_enhanced(self):
         """強化された音声を再生"""
-        if self.enhanced_audio is None:
+        if not self._has_source("enhanced"):
             return
         
         self.stop_playback()
@@ -248,6 +365,15 @@ class AudioPreviewPanel(QWidget):
         if self.prepare_media():
             self.toggle_playback()
     
+    def _on_slider_pressed(self):
+        """スライダーのドラッグ開始"""
+        self._dragging = True
+    
+    def _on_slider_released(self):
+        """スライダーのドラッグ終了"""
+        self._dragging = False
+        self.seek_position()
+    
     def seek_position(self):
         """スライダーから再生位置を設定"""
         if not self.player.isSeekable():
@@ -257,11 +383,27 @@ class AudioPreviewPanel(QWidget):
         position_percent = self.position_slider.value() / self.position_slider.maximum()
         target_pos = int(position_percent * self.audio_length)
         
+        # 直前のシークから50ms以内なら最新の位置だけを後でまとめて反映
+        if self._seek_timer.isActive():
+            self._pending_seek = target_pos
+            self._seek_timer.start()
+            return
+        
         # 再生位置を設定
         self.player.setPosition(target_pos)
+        self._seek_timer.start()
+    
+    def _flush_seek(self):
+        """保留中のシークを反映"""
+        if self._pending_seek is not None:
+            self.player.setPosition(self._pending_seek)
+            self._pending_seek = None
     
     def update_position(self, position):
         """再生位置の更新（ミリ秒単位）"""
+        if self.sender() is not self.player or self._dragging:
+            return
+        
         self.current_position = position
         
         # スライダー位置を更新
@@ -278,6 +420,9 @@ class AudioPreviewPanel(QWidget):
     
     def handle_state_change(self, state):
         """プレーヤーの状態変更処理"""
+        if self.sender() is not self.player:
+            return
+        
         if state == QMediaPlayer.StoppedState:
             self.play_button.setText("再生")
             self.is_playing = False
@@ -288,36 +433,36 @@ class AudioPreviewPanel(QWidget):
     
     def handle_media_status_change(self, status):
         """メディアのステータス変更処理"""
+        if self.sender() is not self.player:
+            return
+        
         if status == QMediaPlayer.EndOfMedia:
             self.playbackFinished.emit()
             self.status_label.setText("再生完了")
     
     def update_time_display(self):
-        """時間表示の更新"""
-        current_mins = int(self.current_position / 1000) // 60
-        current_secs = int(self.current_position / 1000) % 60
+        """時間表示の更新（表示する秒が変わったときのみ）"""
+        key = (int(self.current_position / 1000), int(self.audio_length / 1000))
+        if key == self._last_time_key:
+            return
+        self._last_time_key = key
         
-        total_mins = int(self.audio_length / 1000) // 60
-        total_secs = int(self.audio_length / 1000) % 60
+        current_mins, current_secs = divmod(key[0], 60)
+        total_mins, total_secs = divmod(key[1], 60)
         
         self.time_label.setText(f"{current_mins:02d}:{current_secs:02d} / {total_mins:02d}:{total_secs:02d}")
     
     def cleanup(self):
         """リソースのクリーンアップ"""
         try:
-            # プレーヤーを停止して解放
-            self.player.stop()
-            self.player.setMedia(QMediaContent())
-            
-            # 一時ファイルを削除
-            temp_dir = "./temp"
-            if os.path.exists(temp_dir):
-                for file_name in os.listdir(temp_dir):
-                    if file_name.endswith(".wav"):
-                        try:
-                            os.remove(os.path.join(temp_dir, file_name))
-                        except:
-                            pass
+            # プレーヤーを停止してメディアとバッファを解放
+            for player in self.players.values():
+                player.stop()
+                player.setMedia(QMediaContent())
+            self.media_buffers.clear()
+            self._wav_cache.clear()
+            self._media_files.clear()
+            self._fingerprint = None
         except Exception as e:
             print(f"クリーンアップエラー: {e}")
     
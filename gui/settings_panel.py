@@ -2,10 +2,70 @@
 
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
                            QSlider, QPushButton, QGroupBox, QTabWidget, 
-                           QComboBox, QFileDialog, QInputDialog, QMessageBox)
-from PyQt5.QtCore import Qt, pyqtSignal
-import os
+                           QComboBox, QFileDialog, QInputDialog, QMessageBox,
+                           QApplication)
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal, pyqtSlot
+from pathlib import Path
 import json
+import mmap
+
+from utils import file_utils
+
+# orjsonがあれば高速なJSON変換を使用（なければ標準のjson）
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _dumps(obj):
+    """JSONをUTF-8のバイト列に変換（インデント2）"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2, ensure_ascii=False).encode('utf-8')
+
+def _loads(data):
+    """UTF-8のバイト列（memoryview可）からJSONを読み込み"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(bytes(data))
+
+class PercentLabel(QLabel):
+    """スライダー値をパーセント表示するラベル（ドラッグ中の更新は間引いて反映）"""
+    
+    UPDATE_INTERVAL = 40  # ミリ秒
+    
+    # 0〜100%の表示文字列（スライダーの範囲分を事前に作成）
+    TEXTS = tuple(f"{i}%" for i in range(101))
+    
+    @classmethod
+    def format(cls, value):
+        """値のパーセント表示文字列"""
+        if 0 <= value <= 100:
+            return cls.TEXTS[value]
+        return f"{value}%"
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        
+        # 表示待ちの値と、一定間隔でまとめて表示するためのタイマー
+        self._pending = None
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(self.UPDATE_INTERVAL)
+        self._timer.timeout.connect(self._flush)
+    
+    @pyqtSlot(int)
+    def setPercent(self, value):
+        """値をパーセント表示に設定（間隔内の変更は最後の値のみ表示）"""
+        self._pending = value
+        if not self._timer.isActive():
+            self._timer.start()
+    
+    def _flush(self):
+        """表示待ちの値を反映"""
+        if self._pending is not None:
+            self.setText(self.format(self._pending))
+            self._pending = None
 
 class SettingsPanel(QWidget):
     """詳細設定パネル - 音声強化の詳細パラメータを制御するUI"""
@@ -26,9 +86,23 @@ class SettingsPanel(QWidget):
         }
         
         # プリセット関連
-        self.preset_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "presets")
-        if not os.path.exists(self.preset_dir):
-            os.makedirs(self.preset_dir)
+        self.preset_dir = Path(__file__).resolve().parent.parent / "presets"
+        self.preset_dir.mkdir(parents=True, exist_ok=True)
+        self.preset_file = self.preset_dir / "presets.json"
+        
+        # 最後にディスクへ書き込んだ内容（変更がなければ書き込まない）
+        self._last_saved_bytes = None
+        
+        # 連続した保存をまとめて一度だけ書き込むためのタイマー
+        self._save_timer = QTimer(self)
+        self._save_timer.setSingleShot(True)
+        self._save_timer.setInterval(500)
+        self._save_timer.timeout.connect(self.save_presets_to_disk)
+        
+        # 終了時に保留中の保存を書き込む
+        app = QApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.flush_pending_save)
         
         self.presets = {
             "デフォルト": self.settings.copy(),
@@ -58,11 +132,18 @@ class SettingsPanel(QWidget):
             }
         }
         
+        # スライダーをドラッグ中か（ドラッグ中は再処理を行わない）
+        self._dragging = False
+        
+        # UIの変更回数と、設定値に反映済みの回数（同じならUIを読み直さない）
+        self._ui_version = 0
+        self._settings_version = -1
+        
+        # プリセットタブは初めて表示されるときに作成する
+        self._preset_tab_built = False
+        
         # UI初期化
         self.init_ui()
-        
-        # プリセットの読み込み
-        self.load_presets_from_disk()
     
     def init_ui(self):
         """UIコンポーネントの初期化"""
@@ -86,10 +167,10 @@ class SettingsPanel(QWidget):
         self.create_prosody_tab()
         self.tabs.addTab(self.prosody_tab, "韻律")
         
-        # プリセットタブ
+        # プリセットタブ（中身とプリセットの読み込みは初回表示時）
         self.preset_tab = QWidget()
-        self.create_preset_tab()
         self.tabs.addTab(self.preset_tab, "プリセット")
+        self.tabs.currentChanged.connect(self._maybe_build_tab)
         
         layout.addWidget(self.tabs)
         
@@ -98,6 +179,18 @@ class SettingsPanel(QWidget):
         self.apply_button.clicked.connect(self.apply_settings)
         layout.addWidget(self.apply_button)
         
+        # 設定キーとスライダー・ラベルの対応
+        self._slider_specs = [
+            ("spectrum_enhance", self.spectrum_slider, self.spectrum_label),
+            ("fluctuation", self.fluctuation_slider, self.fluctuation_label),
+            ("voice_quality", self.voice_quality_slider, self.voice_quality_label),
+            ("breathiness", self.breath_slider, self.breath_label),
+            ("pitch_variation", self.pitch_variation_slider, self.pitch_variation_label),
+            ("speed_variation", self.speed_variation_slider, self.speed_variation_label),
+        ]
+        for _, slider, _ in self._slider_specs:
+            slider.valueChanged.connect(self._mark_ui_changed)
+        
         # 初期値を設定
         self.update_ui_from_settings()
     
@@ -112,10 +205,10 @@ class SettingsPanel(QWidget):
         self.spectrum_slider = QSlider(Qt.Horizontal)
         self.spectrum_slider.setRange(0, 100)
         self.spectrum_slider.setValue(int(self.settings["spectrum_enhance"] * 100))
-        self.spectrum_label = QLabel(f"{int(self.settings['spectrum_enhance'] * 100)}%")
-        self.spectrum_slider.valueChanged.connect(
-            lambda v: self.spectrum_label.setText(f"{v}%")
-        )
+        self.spectrum_label = PercentLabel(f"{int(self.settings['spectrum_enhance'] * 100)}%")
+        self.spectrum_slider.valueChanged.connect(self.spectrum_label.setPercent)
+        self.spectrum_slider.sliderPressed.connect(self._begin_drag)
+        self.spectrum_slider.sliderReleased.connect(self._end_drag)
         
         spectrum_layout.addWidget(QLabel("高周波強調レベル:"))
         spectrum_layout.addWidget(self.spectrum_slider)
@@ -128,10 +221,10 @@ class SettingsPanel(QWidget):
         self.fluctuation_slider = QSlider(Qt.Horizontal)
         self.fluctuation_slider.setRange(0, 100)
         self.fluctuation_slider.setValue(int(self.settings["fluctuation"] * 100))
-        self.fluctuation_label = QLabel(f"{int(self.settings['fluctuation'] * 100)}%")
-        self.fluctuation_slider.valueChanged.connect(
-            lambda v: self.fluctuation_label.setText(f"{v}%")
-        )
+        self.fluctuation_label = PercentLabel(f"{int(self.settings['fluctuation'] * 100)}%")
+        self.fluctuation_slider.valueChanged.connect(self.fluctuation_label.setPercent)
+        self.fluctuation_slider.sliderPressed.connect(self._begin_drag)
+        self.fluctuation_slider.sliderReleased.connect(self._end_drag)
         
         fluctuation_layout.addWidget(QLabel("揺らぎの強さ:"))
         fluctuation_layout.addWidget(self.fluctuation_slider)
@@ -152,10 +245,10 @@ class SettingsPanel(QWidget):
         self.voice_quality_slider = QSlider(Qt.Horizontal)
         self.voice_quality_slider.setRange(0, 100)
         self.voice_quality_slider.setValue(int(self.settings["voice_quality"] * 100))
-        self.voice_quality_label = QLabel(f"{int(self.settings['voice_quality'] * 100)}%")
-        self.voice_quality_slider.valueChanged.connect(
-            lambda v: self.voice_quality_label.setText(f"{v}%")
-        )
+        self.voice_quality_label = PercentLabel(f"{int(self.settings['voice_quality'] * 100)}%")
+        self.voice_quality_slider.valueChanged.connect(self.voice_quality_label.setPercent)
+        self.voice_quality_slider.sliderPressed.connect(self._begin_drag)
+        self.voice_quality_slider.sliderReleased.connect(self._end_drag)
         
         voice_layout.addWidget(QLabel("声質向上レベル:"))
         voice_layout.addWidget(self.voice_quality_slider)
@@ -168,10 +261,10 @@ class SettingsPanel(QWidget):
         self.breath_slider = QSlider(Qt.Horizontal)
         self.breath_slider.setRange(0, 100)
         self.breath_slider.setValue(int(self.settings["breathiness"] * 100))
-        self.breath_label = QLabel(f"{int(self.settings['breathiness'] * 100)}%")
-        self.breath_slider.valueChanged.connect(
-            lambda v: self.breath_label.setText(f"{v}%")
-        )
+        self.breath_label = PercentLabel(f"{int(self.settings['breathiness'] * 100)}%")
+        self.breath_slider.valueChanged.connect(self.breath_label.setPercent)
+        self.breath_slider.sliderPressed.connect(self._begin_drag)
+        self.breath_slider.sliderReleased.connect(self._end_drag)
         
         breath_layout.addWidget(QLabel("息の音の強さ:"))
         breath_layout.addWidget(self.breath_slider)
@@ -192,10 +285,10 @@ class SettingsPanel(QWidget):
         self.pitch_variation_slider = QSlider(Qt.Horizontal)
         self.pitch_variation_slider.setRange(0, 100)
         self.pitch_variation_slider.setValue(int(self.settings["pitch_variation"] * 100))
-        self.pitch_variation_label = QLabel(f"{int(self.settings['pitch_variation'] * 100)}%")
-        self.pitch_variation_slider.valueChanged.connect(
-            lambda v: self.pitch_variation_label.setText(f"{v}%")
-        )
+        self.pitch_variation_label = PercentLabel(f"{int(self.settings['pitch_variation'] * 100)}%")
+        self.pitch_variation_slider.valueChanged.connect(self.pitch_variation_label.setPercent)
+        self.pitch_variation_slider.sliderPressed.connect(self._begin_drag)
+        self.pitch_variation_slider.sliderReleased.connect(self._end_drag)
         
         pitch_layout.addWidget(QLabel("ピッチ変動の自然さ:"))
         pitch_layout.addWidget(self.pitch_variation_slider)
@@ -208,10 +301,10 @@ class SettingsPanel(QWidget):
         self.speed_variation_slider = QSlider(Qt.Horizontal)
         self.speed_variation_slider.setRange(0, 100)
         self.speed_variation_slider.setValue(int(self.settings["speed_variation"] * 100))
-        self.speed_variation_label = QLabel(f"{int(self.settings['speed_variation'] * 100)}%")
-        self.speed_variation_slider.valueChanged.connect(
-            lambda v: self.speed_variation_label.setText(f"{v}%")
-        )
+        self.speed_variation_label = PercentLabel(f"{int(self.settings['speed_variation'] * 100)}%")
+        self.speed_variation_slider.valueChanged.connect(self.speed_variation_label.setPercent)
+        self.speed_variation_slider.sliderPressed.connect(self._begin_drag)
+        self.speed_variation_slider.sliderReleased.connect(self._end_drag)
         
         speed_layout.addWidget(QLabel("速度変動の自然さ:"))
         speed_layout.addWidget(self.speed_variation_slider)
@@ -221,6 +314,13 @@ class SettingsPanel(QWidget):
         layout.addWidget(speed_group)
         layout.addStretch()
     
+    def _maybe_build_tab(self, index):
+        """タブが初めて表示されたときに遅延作成する"""
+        if self.tabs.widget(index) is self.preset_tab and not self._preset_tab_built:
+            self._preset_tab_built = True
+            self.create_preset_tab()
+            self.load_presets_from_disk()
+    
     def create_preset_tab(self):
         """プリセットタブの作成"""
         layout = QVBoxLayout(self.preset_tab)
@@ -267,43 +367,44 @@ class SettingsPanel(QWidget):
     
     def update_ui_from_settings(self):
         """現在の設定値からUIを更新"""
-        # スペクトル強化
-        self.spectrum_slider.setValue(int(self.settings["spectrum_enhance"] * 100))
-        self.spectrum_label.setText(f"{int(self.settings['spectrum_enhance'] * 100)}%")
-        
-        # 自然揺らぎ
-        self.fluctuation_slider.setValue(int(self.settings["fluctuation"] * 100))
-        self.fluctuation_label.setText(f"{int(self.settings['fluctuation'] * 100)}%")
-        
-        # 声質
-        self.voice_quality_slider.setValue(int(self.settings["voice_quality"] * 100))
-        self.voice_quality_label.setText(f"{int(self.settings['voice_quality'] * 100)}%")
-        
-        # 息の音
-        self.breath_slider.setValue(int(self.settings["breathiness"] * 100))
-        self.breath_label.setText(f"{int(self.settings['breathiness'] * 100)}%")
-        
-        # ピッチ変動
-        self.pitch_variation_slider.setValue(int(self.settings["pitch_variation"] * 100))
-        self.pitch_variation_label.setText(f"{int(self.settings['pitch_variation'] * 100)}%")
+        for key, slider, label in self._slider_specs:
+            value = int(self.settings[key] * 100)
+            slider.setValue(value)
+            label.setText(PercentLabel.format(value))
         
-        # 速度変動
-        self.speed_variation_slider.setValue(int(self.settings["speed_variation"] * 100))
-        self.speed_variation_label.setText(f"{int(self.settings['speed_variation'] * 100)}%")
+        # 設定値はスライダー値と丸めが異なるため、次回はUIから読み直す
+        self._ui_version += 1
+    
+    def _mark_ui_changed(self):
+        """スライダーの変更を記録"""
+        self._ui_version += 1
+    
+    def _begin_drag(self):
+        """スライダーのドラッグ開始（離すまで設定を適用しない）"""
+        self._dragging = True
+    
+    def _end_drag(self):
+        """スライダーのドラッグ終了（最終値で設定を適用）"""
+        self._dragging = False
+        self.apply_settings()
     
     def apply_settings(self):
         """現在の設定を適用"""
+        if self._dragging:
+            return
+        
         self.update_settings_from_ui()
-        self.settings_changed.emit(self.settings)
+        # 受け取り側が書き換えても、UIとの同期を前提にした内部の設定に影響しないよう複製を渡す
+        self.settings_changed.emit(self.settings.copy())
 
     def update_settings_from_ui(self):
-        """UIから設定値を更新"""
-        self.settings["spectrum_enhance"] = self.spectrum_slider.value() / 100.0
-        self.settings["fluctuation"] = self.fluctuation_slider.value() / 100.0
-        self.settings["voice_quality"] = self.voice_quality_slider.value() / 100.0
-        self.settings["breathiness"] = self.breath_slider.value() / 100.0
-        self.settings["pitch_variation"] = self.pitch_variation_slider.value() / 100.0
-        self.settings["speed_variation"] = self.speed_variation_slider.value() / 100.0
+        """UIから設定値を更新（前回から変更がなければ何もしない）"""
+        if self._settings_version == self._ui_version:
+            return
+        
+        for key, slider, _ in self._slider_specs:
+            self.settings[key] = slider.value() / 100.0
+        self._settings_version = self._ui_version
     
     def get_current_settings(self):
         """現在の設定を取得"""
@@ -321,8 +422,8 @@ class SettingsPanel(QWidget):
         self.settings = self.presets[preset_name].copy()
         self.update_ui_from_settings()
         
-        # 設定変更イベントを発行
-        self.settings_changed.emit(self.settings)
+        # 設定変更イベントを発行（複製を渡す）
+        self.settings_changed.emit(self.settings.copy())
         
         QMessageBox.information(self, "プリセット読み込み", f"プリセット '{preset_name}' を読み込みました。")
     
@@ -336,8 +437,8 @@ class SettingsPanel(QWidget):
         # プリセットに保存
         self.presets[preset_name] = self.settings.copy()
         
-        # ディスクに保存
-        self.save_presets_to_disk()
+        # ディスクに保存（少し待ってまとめて書き込む）
+        self._save_timer.start()
         
         QMessageBox.information(self, "プリセット保存", f"現在の設定をプリセット '{preset_name}' として保存しました。")
     
@@ -372,20 +473,22 @@ class SettingsPanel(QWidget):
         # 現在のプリセットとして選択
         self.preset_combo.setCurrentText(preset_name)
         
-        # ディスクに保存
-        self.save_presets_to_disk()
+        # ディスクに保存（少し待ってまとめて書き込む）
+        self._save_timer.start()
         
         QMessageBox.information(self, "プリセット作成", f"新規プリセット '{preset_name}' を作成しました。")
     
     def load_presets_from_disk(self):
         """ディスクからプリセットを読み込み"""
-        preset_file = os.path.join(self.preset_dir, "presets.json")
-        if not os.path.exists(preset_file):
+        if not self.preset_file.exists():
             return
         
         try:
-            with open(preset_file, 'r', encoding='utf-8') as f:
-                loaded_presets = json.load(f)
+            # ファイルをメモリマップしてコピーせずにパーサーへ渡す
+            with open(self.preset_file, 'rb') as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+                    memoryview(mm) as view:
+                loaded_presets = _loads(view)
             
             # 組み込みプリセットを上書きしないようにする
             for preset_name, preset_data in loaded_presets.items():
@@ -402,19 +505,25 @@ class SettingsPanel(QWidget):
         except Exception as e:
             print(f"プリセット読み込みエラー: {e}")
     
+    def flush_pending_save(self):
+        """保留中のプリセット保存があればすぐに書き込む"""
+        if self._save_timer.isActive():
+            self._save_timer.stop()
+            self.save_presets_to_disk()
+    
     def save_presets_to_disk(self):
         """ディスクにプリセットを保存"""
-        preset_file = os.path.join(self.preset_dir, "presets.json")
-        
         try:
-            # ディレクトリの存在確認
-            if not os.path.exists(self.preset_dir):
-                os.makedirs(self.preset_dir)
+            # バイト列にまとめ、前回の保存から変更がなければ書き込まない
+            data = _dumps(self.presets)
+            if data == self._last_saved_bytes:
+                return
             
-            with open(preset_file, 'w', encoding='utf-8') as f:
-                json.dump(self.presets, f, indent=2, ensure_ascii=False)
+            # 一時ファイルに一度に書き込んでから置き換える（失敗しても既存のプリセットを壊さない）
+            file_utils.write_file_atomic(self.preset_file, data)
+            self._last_saved_bytes = data
             
-            print(f"プリセットを保存しました: {preset_file}")
+            print(f"プリセットを保存しました: {self.preset_file}")
         except Exception as e:
             print(f"プリセット保存エラー: {e}")
             QMessageBox.warning(self, "エラー", f"プリセットの保存に失敗しました: {e}")
\ No newline at end of file
@@ -13,7 +13,6 @@ sys.excepthook = traceback.print_exception
 # 必要なライブラリのインポート
 try:
     from PyQt5.QtWidgets import QApplication
-    import pygame
 except ImportError as e:
     print(f"必要なライブラリが見つかりません: {e}")
     print("以下のコマンドを実行してください:")
@@ -30,9 +29,6 @@ def main():
     # 必要なディレクトリの作成
     os.makedirs("output", exist_ok=True)
     
-    # PyGameの初期化（音声再生用）
-    pygame.init()
-    
     # アプリケーションの初期化
     app = QApplication(sys.argv)
     
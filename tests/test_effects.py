@@ -0,0 +1,25 @@
+"""音声エフェクトのテスト"""
+
+import numpy as np
+import pytest
+
+from audio import effects
+
+
+@pytest.mark.parametrize("n_samples", [0, 1, 3, 255])
+def test_adjust_pitch_variation_short_input(n_samples):
+    """1フレームに満たない短い音声はそのまま返す"""
+    audio = np.ones(n_samples, dtype=np.float32)
+
+    result = effects.adjust_pitch_variation(audio, 24000, variation_amount=0.3)
+
+    assert np.array_equal(result, audio)
+
+
+def test_adjust_pitch_variation_keeps_length():
+    """通常の長さの音声では長さを保って処理する"""
+    audio = np.random.default_rng(0).standard_normal(24000).astype(np.float32) * 0.1
+
+    result = effects.adjust_pitch_variation(audio, 24000, variation_amount=0.3)
+
+    assert len(result) == len(audio)
@@ -0,0 +1,17 @@
+"""AudioProcessorのテスト"""
+
+import numpy as np
+
+from audio.processor import AudioProcessor
+
+
+def test_enhance_pitch_variation_odd_frame_length():
+    """len // 4 が奇数でも、ピッチ変動なしなら入力をほぼそのまま再構成する"""
+    processor = AudioProcessor()
+    n_samples = 5004  # len // 4 == 1251
+    audio = (0.5 * np.sin(2 * np.pi * 220 * np.arange(n_samples) / processor.sample_rate)).astype(np.float32)
+
+    result = processor.enhance_pitch_variation(audio.copy(), variation_amount=0.0)
+
+    assert len(result) == n_samples
+    assert np.abs(result - audio).max() < 1e-3
@@ -1,12 +1,15 @@
 """ファイル操作ユーティリティ"""
 
 import os
+import re
 import json
 import tempfile
-import shutil
 import soundfile as sf
 import numpy as np
 
+# ファイル名に使えない文字（英数字・日本語などの文字と「._- 」以外）
+_UNSAFE_FILENAME_CHARS = re.compile(r'[^\w.\- ]')
+
 def ensure_dir(directory):
     """ディレクトリが存在することを確認し、必要なら作成する"""
     if not os.path.exists(directory):
@@ -14,11 +17,9 @@ def ensure_dir(directory):
     return directory
 
 def sanitize_filename(filename):
-    """ファイル名を安全な形式に変換"""
-    # 使用できない文字を置換
-    invalid_chars = '<>:"/\\|?*'
-    for char in invalid_chars:
-        filename = filename.replace(char, '_')
+    """ファイル名を安全な形式に変換（使えない文字は取り除く）"""
+    # 使用できない文字を一度の走査で除去
+    filename = _UNSAFE_FILENAME_CHARS.sub('', filename)
     
     # 長すぎる場合は切り詰める
     if len(filename) > 100:
@@ -27,14 +28,33 @@ def sanitize_filename(filename):
     
     return filename
 
+def write_file_atomic(file_path, data):
+    """バイト列をアトミックに書き込む（同じディレクトリの一時ファイルから置き換え、失敗時は一時ファイルを削除）"""
+    directory = os.path.dirname(os.fspath(file_path))
+    with tempfile.NamedTemporaryFile('wb', delete=False, dir=directory or None) as temp_file:
+        temp_path = temp_file.name
+        try:
+            temp_file.write(data)
+        except BaseException:
+            temp_file.close()
+            os.remove(temp_path)
+            raise
+    
+    try:
+        # 同一ファイルシステム上のリネームで完成したファイルに置き換える（アトミック）
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
 def save_audio(audio_data, sample_rate, file_path):
     """音声データをファイルに保存"""
     # ディレクトリの存在確認
     directory = os.path.dirname(file_path)
     ensure_dir(directory)
     
-    # 保存
-    sf.write(file_path, audio_data, sample_rate)
+    # 16bit PCMで保存（範囲外のサンプルは事前にクリップ）
+    sf.write(file_path, np.clip(audio_data, -1.0, 1.0), sample_rate, subtype='PCM_16')
     
     return os.path.exists(file_path)
 
@@ -42,15 +62,12 @@ def save_settings(settings, file_path):
     """設定をJSONファイルに保存"""
     # ディレクトリの存在確認
     directory = os.path.dirname(file_path)
-    ensure_dir(directory)
-    
-    # 一時ファイルに書き込んでから移動（書き込みエラー防止）
-    with tempfile.NamedTemporaryFile('w', delete=False) as temp_file:
-        json.dump(settings, temp_file, indent=2, ensure_ascii=False)
-        temp_path = temp_file.name
+    if directory:
+        ensure_dir(directory)
     
-    # 完成したファイルを目的の場所に移動
-    shutil.move(temp_path, file_path)
+    # 先に文字列化しておき（変換エラーでは一時ファイルを作らない）、1回の書き込みで置き換える
+    data = json.dumps(settings, indent=2, ensure_ascii=False, separators=(',', ': ')).encode('utf-8')
+    write_file_atomic(file_path, data)
     
     return os.path.exists(file_path)
 
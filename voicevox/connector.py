@@ -1,28 +1,156 @@
 """VOICEVOXとの連携モジュール - VOICEVOXエンジンAPIとの通信を担当"""
 
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import io
 import os
-import tempfile
+import sys
+import logging
+import json
+import struct
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
 import soundfile as sf
 import numpy as np
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# 合成ごとの進行状況はDEBUGレベルでのみ出力する（通常時は書式化もしない）
+logger = logging.getLogger(__name__)
+
+# orjsonがあれば高速なJSON変換を使用（なければ標準のjson）
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _dumps(obj):
+    """JSONをUTF-8のバイト列に変換"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+def _loads(data):
+    """UTF-8のバイト列からJSONを読み込み"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _decode_wav(data):
+    """16bitモノラルPCMのWAVバイト列をfloat32として直接読み込み（それ以外の形式はNone）"""
+    if len(data) < 12 or data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        return None
+    
+    # チャンクを順にたどってfmtとdataを探す
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        chunk_size, = struct.unpack_from('<I', data, offset + 4)
+        body = offset + 8
+        
+        if chunk_id == b'fmt ' and chunk_size >= 16:
+            fmt = struct.unpack_from('<HHIIHH', data, body)
+        elif chunk_id == b'data':
+            if fmt is None:
+                return None
+            format_tag, channels, sample_rate, _, _, bits = fmt
+            if format_tag != 1 or channels != 1 or bits != 16:
+                return None
+            
+            # soundfileと同じく[-1, 1)のfloat32に変換
+            n_samples = min(chunk_size, len(data) - body) // 2
+            pcm = np.frombuffer(data, dtype='<i2', count=n_samples, offset=body)
+            return np.multiply(pcm, np.float32(1 / 32768), dtype=np.float32), sample_rate
+        
+        offset = body + chunk_size + (chunk_size & 1)
+    
+    return None
+
+def _default_cache_dir():
+    """合成結果キャッシュの既定の場所（ユーザーのキャッシュディレクトリ内）"""
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or Path.home() / "AppData" / "Local"
+    elif sys.platform == 'darwin':
+        base = Path.home() / "Library" / "Caches"
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or Path.home() / ".cache"
+    return Path(base) / "voicevox-enhancer" / "tts"
 
 class VoicevoxConnector:
     """VOICEVOX音声合成エンジンとの連携クラス"""
     
-    def __init__(self, host="127.0.0.1", port=50021):
-        """初期化"""
+    # メモリ上に保持する音声クエリの最大件数
+    QUERY_CACHE_SIZE = 128
+    
+    # 話者一覧を再取得せずに使い回す時間（秒）
+    SPEAKERS_TTL = 300.0
+    
+    # 合成リクエストのヘッダ（呼び出しごとに作り直さない）
+    JSON_HEADERS = {"Content-Type": "application/json"}
+    
+    # 後段の処理に合わせた合成音声の出力形式
+    OUTPUT_SAMPLING_RATE = 24000
+    OUTPUT_STEREO = False
+    
+    # ディスク上の合成結果キャッシュの上限（超えたら古いものから削除する）
+    CACHE_MAX_BYTES = 256 * 1024 * 1024
+    
+    # 最後に接続したエンジンのバージョンを記録するファイル（キャッシュディレクトリ内）
+    VERSION_FILE = "engine_version.json"
+    
+    def __init__(self, host="127.0.0.1", port=50021, cache_dir=None, use_cache=True):
+        """初期化（cache_dirを省略するとユーザーのキャッシュディレクトリ、use_cache=Falseでキャッシュ無効）"""
         self.base_url = f"http://{host}:{port}"
+        self._audio_query_url = f"{self.base_url}/audio_query"
+        self._synthesis_url = f"{self.base_url}/synthesis"
         self.speakers = {}
+        self._speakers_time = None
+        self._speakers_version = None
+        self.engine_version = None
         self.initialized = False
+        
+        # 合成結果のキャッシュ（同じテキストと話者なら通信を省略する）
+        self.use_cache = use_cache
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else _default_cache_dir()
+        self._cache_bytes = None
+        
+        # 接続前でもキャッシュを引けるよう、前回記録したエンジンのバージョンを使う
+        self.engine_version = self._load_engine_version()
+        self._query_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        
+        # 接続を使い回すためのセッション（バッチ処理の並列数に合わせたプール）
+        # 接続の失敗と、切れたキープアライブ接続での切断（urllib3では読み込みエラー扱い）は
+        # 短い間隔で再試行する。VOICEVOXのPOSTは副作用がないため再送対象に含める
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            max_retries=Retry(
+                total=2, connect=2, read=1, status=0, backoff_factor=0.1,
+                allowed_methods=frozenset({"GET", "POST"})
+            )
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+    
+    def close(self):
+        """セッションを閉じて接続を解放"""
+        self.session.close()
     
     def test_connection(self):
         """VOICEVOXサーバーへの接続テスト"""
         try:
-            response = requests.get(f"{self.base_url}/version", timeout=3)
+            response = self.session.get(f"{self.base_url}/version", timeout=3)
             if response.status_code == 200:
-                print(f"VOICEVOX接続成功: バージョン {response.json()}")
+                self._set_engine_version(_loads(response.content))
+                print(f"VOICEVOX接続成功: バージョン {self.engine_version}")
                 self.initialized = True
                 return True
             else:
@@ -37,20 +165,32 @@ class VoicevoxConnector:
             return False
     
     def get_speakers(self):
-        """利用可能な話者の一覧を取得"""
+        """利用可能な話者の一覧を取得（一定時間内は前回の結果を使う）"""
+        if (self.speakers and self._speakers_time is not None
+                and time.monotonic() - self._speakers_time < self.SPEAKERS_TTL):
+            return True
+        
+        # 期限切れでもエンジンのバージョンが変わっていなければ一覧を取り直さない
+        if self.speakers and self._speakers_version is not None:
+            if self._fetch_version() == self._speakers_version:
+                self._speakers_time = time.monotonic()
+                return True
+        
         if not self.initialized:
             if not self.test_connection():
                 return False
         
         try:
-            response = requests.get(f"{self.base_url}/speakers")
+            response = self.session.get(f"{self.base_url}/speakers")
             if response.status_code == 200:
-                speakers_data = response.json()
-                self.speakers = {}
-                
-                for speaker in speakers_data:
-                    for style in speaker["styles"]:
-                        self.speakers[style["id"]] = f"{speaker['name']}（{style['name']}）"
+                speakers_data = _loads(response.content)
+                self.speakers = {
+                    style["id"]: f"{speaker['name']}（{style['name']}）"
+                    for speaker in speakers_data
+                    for style in speaker["styles"]
+                }
+                self._speakers_time = time.monotonic()
+                self._speakers_version = self.engine_version
                 
                 print(f"話者情報取得成功: {len(self.speakers)}件の話者スタイルを取得")
                 return True
@@ -62,67 +202,252 @@ class VoicevoxConnector:
             traceback.print_exc()
             return False
     
+    def _fetch_version(self):
+        """エンジンのバージョンを取得（失敗した場合はNone）"""
+        try:
+            response = self.session.get(f"{self.base_url}/version", timeout=1)
+            if response.status_code == 200:
+                self._set_engine_version(_loads(response.content))
+                return self.engine_version
+        except Exception:
+            pass
+        return None
+    
+    def _load_engine_version(self):
+        """前回記録したエンジンのバージョンを読み込み（なければNone）"""
+        if not self.use_cache:
+            return None
+        try:
+            with open(self.cache_dir / self.VERSION_FILE, 'rb') as f:
+                return _loads(f.read())
+        except (OSError, ValueError):
+            return None
+    
+    def _set_engine_version(self, version):
+        """エンジンのバージョンを更新し、変わっていればキャッシュディレクトリに記録"""
+        if version == self.engine_version:
+            return
+        self.engine_version = version
+        if not self.use_cache:
+            return
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            path = self.cache_dir / self.VERSION_FILE
+            temp_path = path.with_name(f"{self.VERSION_FILE}.{threading.get_ident()}.tmp")
+            with open(temp_path, 'wb') as f:
+                f.write(_dumps(version))
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"キャッシュ書き込みエラー: {e}")
+    
     def text_to_speech(self, text, speaker_id=1):
         """テキストから音声を合成"""
         if not text:
             raise ValueError("テキストが空です")
         
-        if not self.initialized:
-            if not self.test_connection():
-                raise ConnectionError("VOICEVOXエンジンに接続できません")
-        
         try:
-            # 音声合成用のクエリを作成
-            params = {"text": text, "speaker": speaker_id}
-            print(f"音声クエリ作成開始: テキスト={text[:20]}..., 話者ID={speaker_id}")
-            
-            response = requests.post(
-                f"{self.base_url}/audio_query",
-                params=params
-            )
-            
-            if response.status_code != 200:
-                raise Exception(f"音声クエリの作成に失敗しました: {response.status_code}")
-            
-            query = response.json()
-            print("音声クエリ作成成功")
+            # キャッシュにあれば通信せずに読み込む（接続前は前回のエンジンのバージョンで照合）
+            key = self._cache_key(text, speaker_id)
+            wav_bytes = self._read_cached_wav(key)
+            if wav_bytes is None:
+                if not self.initialized:
+                    if not self.test_connection():
+                        raise ConnectionError("VOICEVOXエンジンに接続できません")
+                    # 接続時にバージョンが変わっていればキーも変わる
+                    key = self._cache_key(text, speaker_id)
+                
+                wav_bytes = self._synthesize(text, speaker_id)
+                self._write_cached_wav(key, wav_bytes)
             
-            # 音声を合成
-            params = {"speaker": speaker_id}
-            print(f"音声合成開始: 話者ID={speaker_id}")
+            # 音声データをメモリ上で読み込み（一時ファイルは使わない）
+            # 通常の16bit PCMはヘッダを直接解析し、それ以外はsoundfileで読み込む
+            decoded = _decode_wav(wav_bytes)
+            if decoded is None:
+                decoded = sf.read(io.BytesIO(wav_bytes), dtype='float32')
+            audio_data, sample_rate = decoded
             
-            response = requests.post(
-                f"{self.base_url}/synthesis",
-                headers={"Content-Type": "application/json"},
-                params=params,
-                data=json.dumps(query)
-            )
+            return audio_data, sample_rate
             
+        except Exception as e:
+            print(f"音声合成エラー: {e}")
+            traceback.print_exc()
+            raise
+    
+    def _synthesize(self, text, speaker_id):
+        """VOICEVOXエンジンで音声を合成してWAVバイト列を取得"""
+        # 音声合成用のクエリを作成
+        query = self._get_audio_query(text, speaker_id)
+        
+        # 後段の処理に合わせて24kHzモノラルで出力させる
+        query["outputSamplingRate"] = self.OUTPUT_SAMPLING_RATE
+        query["outputStereo"] = self.OUTPUT_STEREO
+        
+        # 音声を合成
+        params = {"speaker": speaker_id}
+        logger.debug("音声合成開始: 話者ID=%s", speaker_id)
+        
+        with self.session.post(
+            self._synthesis_url,
+            headers=self.JSON_HEADERS,
+            params=params,
+            data=_dumps(query),
+            stream=True
+        ) as response:
             if response.status_code != 200:
                 raise Exception(f"音声合成に失敗しました: {response.status_code}")
             
-            print("音声合成成功")
-            
-            # 一時ファイルに保存
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                temp_path = temp_file.name
-                temp_file.write(response.content)
-            
-            print(f"一時ファイル作成: {temp_path}")
+            wav_bytes = self._read_body(response)
+        
+        logger.debug("音声合成成功")
+        return wav_bytes
+    
+    @staticmethod
+    def _read_body(response, chunk_size=65536):
+        """レスポンス本体を受信しながらbytearrayに書き込む（サイズが分かれば事前確保）"""
+        body = bytearray(int(response.headers.get("Content-Length") or 0))
+        received = 0
+        for chunk in response.iter_content(chunk_size):
+            # 確保したサイズを超える分はbytearrayが自動的に伸びる
+            end = received + len(chunk)
+            body[received:end] = chunk
+            received = end
+        del body[received:]
+        return body
+    
+    def _get_audio_query(self, text, speaker_id):
+        """音声クエリを取得（最近使ったものはメモリから返す）"""
+        key = (text, speaker_id)
+        with self._cache_lock:
+            query = self._query_cache.get(key)
+            if query is not None:
+                self._query_cache.move_to_end(key)
+                return dict(query)
+        
+        params = {"text": text, "speaker": speaker_id}
+        logger.debug("音声クエリ作成開始: テキスト=%.20s..., 話者ID=%s", text, speaker_id)
+        
+        response = self.session.post(
+            self._audio_query_url,
+            params=params
+        )
+        
+        if response.status_code != 200:
+            raise Exception(f"音声クエリの作成に失敗しました: {response.status_code}")
+        
+        query = _loads(response.content)
+        logger.debug("音声クエリ作成成功")
+        
+        with self._cache_lock:
+            self._query_cache[key] = query
+            if len(self._query_cache) > self.QUERY_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+        return dict(query)
+    
+    def _cache_key(self, text, speaker_id):
+        """エンジンのバージョン・出力形式・話者ID・テキストからキャッシュのキーを作成"""
+        source = (f"{self.engine_version}\0{self.OUTPUT_SAMPLING_RATE}\0{self.OUTPUT_STEREO}"
+                  f"\0{speaker_id}\0{text}")
+        return hashlib.blake2b(source.encode('utf-8'), digest_size=16).hexdigest()
+    
+    def _read_cached_wav(self, key):
+        """キャッシュ済みのWAVバイト列を読み込み（なければNone）"""
+        if not self.use_cache:
+            return None
+        
+        path = self.cache_dir / f"{key}.wav"
+        try:
+            with open(path, 'rb') as f:
+                wav_bytes = f.read()
+        except OSError:
+            return None
+        
+        # 更新日時を最終利用日時として扱い、削除の順序に使う
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return wav_bytes
+    
+    def _write_cached_wav(self, key, wav_bytes):
+        """WAVバイト列をキャッシュに書き込み（失敗しても合成は続行）"""
+        if not self.use_cache:
+            return
+        
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
             
-            # 音声データを読み込み
-            audio_data, sample_rate = sf.read(temp_path)
+            # 並列の書き込みで壊れないよう一時ファイルから置き換える
+            path = self.cache_dir / f"{key}.wav"
+            temp_path = path.with_name(f"{key}.{threading.get_ident()}.tmp")
+            with open(temp_path, 'wb') as f:
+                f.write(wav_bytes)
             
-            # 一時ファイル削除
+            # 合計サイズは初回だけ走査し、以降は増えた分を加算して上限を確認する
+            # （同じキーの上書きでは元のサイズを差し引くため、置き換えもロック内で行う）
+            with self._cache_lock:
+                try:
+                    old_size = path.stat().st_size
+                except OSError:
+                    old_size = 0
+                os.replace(temp_path, path)
+                
+                if self._cache_bytes is None:
+                    self._cache_bytes = sum(entry.stat().st_size for entry in self.cache_dir.glob("*.wav"))
+                else:
+                    self._cache_bytes += len(wav_bytes) - old_size
+                if self._cache_bytes > self.CACHE_MAX_BYTES:
+                    self._prune_cache()
+        except OSError as e:
+            print(f"キャッシュ書き込みエラー: {e}")
+    
+    def _prune_cache(self):
+        """最終利用日時の古いキャッシュから削除して上限の8割まで減らす（_cache_lockを保持して呼ぶ）"""
+        entries = []
+        for entry in self.cache_dir.glob("*.wav"):
             try:
-                os.remove(temp_path)
-                print("一時ファイル削除完了")
-            except Exception as e:
-                print(f"一時ファイル削除エラー: {e}")
-            
-            return audio_data, sample_rate
-            
-        except Exception as e:
-            print(f"音声合成エラー: {e}")
-            traceback.print_exc()
-            raise
\ No newline at end of file
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        entries.sort()
+        
+        total = sum(size for _, size, _ in entries)
+        limit = self.CACHE_MAX_BYTES * 0.8
+        for _, size, entry in entries:
+            if total <= limit:
+                break
+            try:
+                entry.unlink()
+                total -= size
+            except OSError:
+                pass
+        self._cache_bytes = total
+    
+    def text_to_speech_many(self, texts, speaker_id=1, max_workers=4):
+        """複数のテキストを並列に音声合成（入力と同じ順序で結果を返す）
+        
+        いずれかの合成に失敗した場合はその例外を送出する。
+        """
+        # 接続確認はスレッドを起動する前に一度だけ行う
+        if not self.initialized:
+            if not self.test_connection():
+                raise ConnectionError("VOICEVOXエンジンに接続できません")
+        
+        # クエリ作成と合成の通信を並列に重ねて待ち時間を短縮
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(partial(self.text_to_speech, speaker_id=speaker_id), texts))
+    
+    def text_to_speech_batch(self, texts, speaker_id=1, max_workers=4):
+        """複数の文を並列に音声合成し、入力の順に1つの音声へ連結して返す"""
+        results = self.text_to_speech_many(texts, speaker_id, max_workers)
+        if not results:
+            raise ValueError("テキストが空です")
+        
+        # 出力は24kHzに揃えているが、念のため一致を確認する
+        sample_rate = results[0][1]
+        if any(rate != sample_rate for _, rate in results):
+            raise ValueError("サンプリングレートが一致しません")
+        
+        # 一度の確保でまとめて連結
+        audio_data = np.concatenate([audio for audio, _ in results]).astype(np.float32, copy=False)
+        return audio_data, sample_rate